@@ -1,26 +1,26 @@
 from __future__ import annotations
 import argparse
-import textwrap
 import sys
 from pathlib import Path
-from dotenv import load_dotenv
 
 from .io_utils import unique_outdir, copy_pdf_to_run
-from . import runners
+
+_EPILOG = (
+    "Examples:\n"
+    "  python -m invoice_chain_ai.main --pdf path/to/file.pdf --parser docling\n"
+    "  python -m invoice_chain_ai.main --pdf path/to/file.pdf --parser marker --use-llm\n"
+)
+
+def default_outdir() -> Path:
+    """Default base directory for run folders (resolved only when a run executes)."""
+    return Path(__file__).parent / "output"
 
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="invoice-chain-ai",
         description="Convert a PDF to Markdown (docling or marker) and extract Swiss QR.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog=textwrap.dedent(
-            """
-            Examples:
-              python -m invoice_chain_ai.main --pdf path/to/file.pdf --parser docling
-              python -m invoice_chain_ai.main --pdf path/to/file.pdf --parser marker --use-llm
-                            
-            """
-        ),
+        epilog=_EPILOG,
     )
     parser.add_argument("--pdf", required=False, type=Path, default=None, help="Path to the input PDF. Optional when using --structured-output with --run-dir.")
     parser.add_argument(
@@ -32,9 +32,9 @@ def _build_parser() -> argparse.ArgumentParser:
     )
     parser.add_argument(
         "--outdir",
-        default=Path(__file__).parent / "output",
+        default=None,
         type=Path,
-        help="Directory to write outputs. A subfolder per run is created inside.",
+        help="Directory to write outputs. A subfolder per run is created inside. (default: invoice_chain_ai/output)",
     )
     parser.add_argument(
         "--use-llm",
@@ -55,24 +55,24 @@ def _build_parser() -> argparse.ArgumentParser:
         "--run-dir",
         default=None,
         type=Path,
-        help="Optional existing run directory to use for --structured-output only runs.",
+        nargs="+",
+        help="Optional existing run directory to use for --structured-output only runs. Several "
+        "directories are processed in one batch of concurrent LLM calls.",
     )
     return parser
 
 def run_cli(argv: list[str] | None = None) -> int:
-    # load dotenv here as well (safe no-op if already loaded)
-    load_dotenv()
-
     parser = _build_parser()
     args = parser.parse_args(argv)
 
     pdf_path: Path | None = args.pdf
     parser_name: str | None = args.parser
-    outdir: Path = args.outdir
+    outdir: Path = args.outdir or default_outdir()
     use_llm: bool = bool(args.use_llm)
     qr_only: bool = bool(args.qr)
     structured_output: bool = bool(args.structured_output)
-    provided_run_dir: Path | None = args.run_dir
+    provided_run_dirs: list[Path] | None = args.run_dir
+    provided_run_dir: Path | None = provided_run_dirs[0] if provided_run_dirs else None
 
     if parser_name == "docling" and use_llm:
         print("Note: --use-llm is ignored for 'docling'.", file=sys.stderr)
@@ -93,6 +93,9 @@ def run_cli(argv: list[str] | None = None) -> int:
         if pdf_path is None and not structured_output:
             print("Error: --pdf is required for non-structured-output runs even when --run-dir is provided.", file=sys.stderr)
             return 2
+        if len(provided_run_dirs) > 1 and (not structured_output or parser_name is not None or qr_only):
+            print("Error: several --run-dir values are only supported for --structured-output without --parser or --qr.", file=sys.stderr)
+            return 2
 
     # require parser unless qr-only or structured-output is requested
     if not qr_only and parser_name is None and not structured_output:
@@ -101,6 +104,22 @@ def run_cli(argv: list[str] | None = None) -> int:
 
     outdir.mkdir(parents=True, exist_ok=True)
 
+    # Heavy imports (docling/marker/LLM stacks) only once arguments are valid,
+    # so --help and argument errors stay cheap.
+    from dotenv import load_dotenv
+    from . import runners
+
+    # load dotenv here as well (safe no-op if already loaded)
+    load_dotenv()
+
+    # Several run directories: batched structured output over their existing markdown
+    if provided_run_dirs and len(provided_run_dirs) > 1:
+        missing = [d for d in provided_run_dirs if not d.is_dir()]
+        if missing:
+            print(f"Error: provided run directory does not exist: {missing[0]}", file=sys.stderr)
+            return 2
+        return runners.run_structured_output_for_run_dirs(provided_run_dirs, pdf_path.stem if pdf_path else None)
+
     # If user provided an existing run directory (for structured-output-only), use it.
     if provided_run_dir:
         run_dir = provided_run_dir
@@ -1,20 +1,10 @@
 from __future__ import annotations
-import json
 from pathlib import Path
-from typing import Optional
 
 DATA_DIR = Path(__file__).parent
 SEED_FILE = DATA_DIR / "seed_customers.json"
 
 
-def _load_customers() -> list[dict]:
-    """Load seed customers from the JSON file next to this module."""
-    try:
-        return json.loads(SEED_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        return []
-
-
 # Export commonly used helpers from db_client for package-level imports
 from .db_client import (
     get_customer_by_iban,
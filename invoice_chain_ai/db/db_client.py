@@ -1,177 +1,315 @@
+from __future__ import annotations
 import os
 import json
+import atexit
+import functools
+import hashlib
+import threading
+from collections.abc import Callable
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Callable
 from dotenv import load_dotenv
 
-load_dotenv()
+# psycopg, langsmith and .env are loaded on first use so importing this module
+# (e.g. via the package __init__) stays cheap for QR-only / offline runs.
+_pg = None
+_dotenv_loaded = False
+_POOL = None
+# the threaded 'all' runner can look customers up concurrently: one lock for the lazy pool init
+_POOL_LOCK = threading.Lock()
+_ATEXIT_REGISTERED = False
+_DB_AVAILABLE: bool | None = None
+# seconds; an unreachable database fails the lookup quickly instead of after psycopg's defaults
+_CONNECT_TIMEOUT = 5
 
-# Try to import psycopg (psycopg-binary). If not available, functions will be no-ops.
-try:
-    import psycopg
-    from psycopg.rows import dict_row
-except Exception:
-    psycopg = None  # type: ignore
 
-# Make langsmith optional: provide a no-op traceable decorator if missing
-try:
-    from langsmith import traceable  # type: ignore
-except Exception:
-    def traceable(*t_args, **t_kwargs) -> Callable:
-        def _decorator(fn):
-            return fn
-        return _decorator
+def _load_env() -> None:
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
+
+
+def _psycopg():
+    """
+    Import psycopg (psycopg-binary) on first use.
+    Returns (psycopg, dict_row), or None if it is not installed.
+    """
+    global _pg
+    if _pg is None:
+        try:
+            import psycopg
+            from psycopg.rows import dict_row
+            _pg = (psycopg, dict_row)
+        except Exception:
+            _pg = False
+    return _pg or None
+
+
+# Make langsmith optional: the real decorator is resolved on the first call of the
+# decorated function; if langsmith is missing the function runs untraced.
+def traceable(*t_args, **t_kwargs) -> Callable:
+    def _decorator(fn):
+        traced = None
+
+        @functools.wraps(fn)
+        def _wrapper(*args, **kwargs):
+            nonlocal traced
+            if traced is None:
+                try:
+                    from langsmith import traceable as _traceable  # type: ignore
+                    traced = _traceable(*t_args, **t_kwargs)(fn)
+                except Exception:
+                    traced = fn
+            return traced(*args, **kwargs)
+        return _wrapper
+    return _decorator
 
 DB_INIT_SQL = str(Path(__file__).parent / "init.sql")
+DEFAULT_PROMPT = "default"
+
+# fallback minimal single-table schema, used when db/init.sql is missing
+_FALLBACK_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS customers (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    customer_prompt TEXT,
+    ibans TEXT[] DEFAULT '{}'::text[],
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS customers_ibans_gin ON customers USING GIN (ibans);
+"""
+
+
+def _db_available() -> bool:
+    """
+    Cached probe: DATABASE_URL is set and psycopg is importable. Lets every public
+    function bail out with a single boolean check when no database is configured.
+    """
+    global _DB_AVAILABLE
+    if _DB_AVAILABLE is None:
+        _load_env()
+        _DB_AVAILABLE = bool(os.getenv("DATABASE_URL")) and _psycopg() is not None
+    return _DB_AVAILABLE
+
+
+def _invalidate_db_cache() -> None:
+    """Forget the availability probe and the pool (e.g. after DATABASE_URL changed)."""
+    global _DB_AVAILABLE
+    _DB_AVAILABLE = None
+    _close_pool()
+
+
+def _close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+
+
+def _pool():
+    """
+    Return the process-wide psycopg_pool.ConnectionPool, created on first use so
+    repeated lookups reuse warm connections. None if the database is unavailable
+    or psycopg_pool is not installed.
+    """
+    global _POOL, _ATEXIT_REGISTERED
+    if _POOL is not None:
+        return _POOL
+    if not _db_available():
+        return None
+    try:
+        from psycopg_pool import ConnectionPool
+    except Exception:
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            _, dict_row = _psycopg()
+            _POOL = ConnectionPool(
+                os.getenv("DATABASE_URL"),
+                min_size=1,
+                max_size=4,
+                kwargs={"row_factory": dict_row, "connect_timeout": _CONNECT_TIMEOUT},
+                timeout=_CONNECT_TIMEOUT,
+                open=True,
+            )
+            if not _ATEXIT_REGISTERED:
+                atexit.register(_close_pool)
+                _ATEXIT_REGISTERED = True
+        return _POOL
+
+
+@contextmanager
+def _connection():
+    """
+    Yield a pooled connection: committed on success, rolled back on error and then
+    returned to the pool. Falls back to a one-off connection when psycopg_pool is not
+    installed. Callers check _db_available() first.
+    """
+    pool = _pool()
+    if pool is not None:
+        with pool.connection() as conn:
+            yield conn
+        return
+    psycopg, dict_row = _psycopg()
+    with psycopg.connect(os.getenv("DATABASE_URL"), row_factory=dict_row, connect_timeout=_CONNECT_TIMEOUT) as conn:
+        yield conn
 
 
-def _get_conn():
-    dsn = os.getenv("DATABASE_URL")
-    if not dsn or psycopg is None:
+@functools.lru_cache(maxsize=1)
+def _read_init_sql() -> str | None:
+    if not os.path.exists(DB_INIT_SQL):
         return None
-    return psycopg.connect(dsn, row_factory=dict_row)
+    with open(DB_INIT_SQL, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _schema_sql() -> str:
+    return _read_init_sql() or _FALLBACK_SCHEMA_SQL
+
+
+@functools.lru_cache(maxsize=1)
+def _schema_version() -> int:
+    """
+    Version recorded in schema_version: derived from the schema DDL itself (31 bits of its
+    sha256, to fit the INT column), so any edit to init.sql makes seeding re-run init_db().
+    """
+    digest = hashlib.sha256(_schema_sql().encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+def _schema_is_current(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_version') AS t;")
+        row = cur.fetchone()
+        if not row or row["t"] is None:
+            return False
+        cur.execute("SELECT 1 FROM schema_version WHERE v = %s;", (_schema_version(),))
+        return cur.fetchone() is not None
 
 
 @traceable(name="Init DB")
 def init_db():
     """
-    Create schema by executing db/init.sql if present.
+    Create schema by executing db/init.sql if present, then record its _schema_version().
     """
-    conn = _get_conn()
-    if conn is None:
+    if not _db_available():
         return {"status": "noop", "reason": "no DATABASE_URL or psycopg not installed"}
-    try:
-        sql = None
-        if os.path.exists(DB_INIT_SQL):
-            with open(DB_INIT_SQL, "r", encoding="utf-8") as f:
-                sql = f.read()
-        with conn:
-            with conn.cursor() as cur:
-                if sql:
-                    cur.execute(sql)
-                else:
-                    # fallback minimal single-table schema
-                    cur.execute(
-                        """
-                        CREATE TABLE IF NOT EXISTS customers (
-                            id SERIAL PRIMARY KEY,
-                            name TEXT NOT NULL,
-                            customer_prompt TEXT,
-                            ibans TEXT[] DEFAULT ''::text[],
-                            created_at TIMESTAMPTZ DEFAULT now()
-                        );
-                        """
-                    )
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_schema_sql())
+            cur.execute("CREATE TABLE IF NOT EXISTS schema_version (v INT PRIMARY KEY);")
+            cur.execute("INSERT INTO schema_version VALUES (%s) ON CONFLICT DO NOTHING;", (_schema_version(),))
         return {"status": "ok"}
-    finally:
-        conn.close()
 
 
 # Internal helpers
-def _find_customer_by_iban(conn, iban: str) -> Optional[Dict[str, Any]]:
+def _normalize_iban(iban: str) -> str:
+    """Compact form used for storage and lookup: no whitespace, upper case."""
+    return "".join(str(iban).split()).upper()
+
+
+def _find_customer_by_iban(conn, iban: str) -> dict[str, object] | None:
     if not iban:
         return None
+    # @> (array contains) can use the GIN index on ibans; = ANY() cannot
     with conn.cursor() as cur:
         cur.execute(
-            "SELECT id, name, customer_prompt, ibans FROM customers WHERE %s = ANY(ibans) LIMIT 1;",
-            (iban,),
+            "SELECT id, name, customer_prompt, ibans FROM customers WHERE ibans @> ARRAY[%s]::text[] LIMIT 1;",
+            (_normalize_iban(iban),),
         )
         return cur.fetchone()
 
 
-def _insert_customer(conn, name: str, customer_prompt: Optional[str], ibans: Optional[List[str]] = None) -> Optional[int]:
+def _copy_customers(conn, rows: list[tuple]) -> int:
     """
-    Insert a customer and return inserted customer id.
-    ibans should be a list of strings or None.
+    Bulk-load (name, customer_prompt, ibans) rows with a single COPY instead of
+    one INSERT round-trip per customer. ibans should be a list of strings.
     """
     with conn.cursor() as cur:
-        cur.execute(
-            "INSERT INTO customers (name, customer_prompt, ibans) VALUES (%s, %s, %s) RETURNING id;",
-            (name, customer_prompt, ibans),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        if isinstance(row, dict):
-            return row.get("id")
-        try:
-            return row[0]
-        except Exception:
-            return None
+        with cur.copy("COPY customers (name, customer_prompt, ibans) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+    return len(rows)
 
 
 # PUBLIC lookup functions
 @traceable(name="Get Customer by IBAN")
-def get_customer_by_iban(iban: str) -> Optional[Dict[str, Any]]:
-    conn = _get_conn()
-    if conn is None:
+def get_customer_by_iban(iban: str) -> dict[str, object] | None:
+    if not iban or not _db_available():
         return None
-    try:
-        with conn:
-            cust = _find_customer_by_iban(conn, iban)
-            if not cust:
-                return None
-            return {"customer": dict(cust)}
-    finally:
-        conn.close()
+    with _connection() as conn:
+        cust = _find_customer_by_iban(conn, iban)
+        if not cust:
+            return None
+        return {"customer": cust}
 
 
 @traceable(name="Get Customer by Invoice (IBAN)")
-def get_customer_by_invoice(parsed_invoice: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def get_customer_by_invoice(parsed_invoice: dict[str, object]) -> dict[str, object] | None:
     """
     Try to find a customer for the parsed_invoice based on the iban.
-    Returns None if no match.
+    No I/O happens when the invoice has none. Returns None if no match.
     """
     iban = parsed_invoice.get("iban")
-    if not iban:
+    if not iban or not _db_available():
         return None
-    return get_customer_by_iban(iban)
+    with _connection() as conn:
+        cust = _find_customer_by_iban(conn, iban)
+        if not cust:
+            return None
+        return {"customer": cust}
 
 
-def seed_customers_from_json(json_path: str) -> Dict[str, Any]:
+def seed_customers_from_json(json_path: str) -> dict[str, object]:
     """
     Load customers from a JSON file and insert into DB.
     Expected format: [{ "name": "...", "customer_prompt": "...", "ibans": ["IBAN...","..."] }, ...]
     This function clears existing customers and seeds fresh data from the JSON.
     """
-    # Ensure DB schema exists / is migrated before seeding
+    if not _db_available():
+        return {"error": "No DATABASE_URL configured or psycopg not installed"}
+
+    # Ensure DB schema exists / is migrated before seeding (skipped if already current)
     try:
-        init_res = init_db()
+        with _connection() as conn:
+            current = _schema_is_current(conn)
+        if not current:
+            init_db()
     except Exception as e:
         return {"error": f"init_db failed: {e}"}
 
-    conn = _get_conn()
-    if conn is None:
-        return {"error": "No DATABASE_URL configured or psycopg not installed"}
-    if not os.path.exists(json_path):
-        return {"error": "seed file not found"}
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    inserted = 0
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("TRUNCATE TABLE customers RESTART IDENTITY CASCADE;")
-            for item in data:
-                name = item.get("name") or "unknown"
-                cust_prompt = item.get("customer_prompt")
-                ibans = item.get("ibans") or []
-                # ensure list type for psycopg to map to text[]
-                if not isinstance(ibans, list):
-                    ibans = [ibans] if ibans else []
-                _insert_customer(conn, name, cust_prompt, ibans)
-                inserted += 1
+    with _connection() as conn:
+        if not os.path.exists(json_path):
+            return {"error": "seed file not found"}
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rows = []
+        for item in data:
+            name = item.get("name") or "unknown"
+            cust_prompt = item.get("customer_prompt")
+            ibans = item.get("ibans") or []
+            # ensure list type for psycopg to map to text[]
+            if not isinstance(ibans, list):
+                ibans = [ibans] if ibans else []
+            # normalize once at seed time so lookups are plain equality checks
+            ibans = [_normalize_iban(i) for i in ibans if i]
+            rows.append((name, cust_prompt, ibans))
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE TABLE customers RESTART IDENTITY CASCADE;")
+        inserted = _copy_customers(conn, rows)
         return {"inserted": inserted}
-    finally:
-        conn.close()
 
 
-def choose_prompt(customer_info: Dict[str, Any]) -> str:
+def choose_prompt(customer_info: dict[str, object] | None) -> str:
     """
-    Return the stored customer_prompt if present; otherwise 'default'.
+    Return the stored customer_prompt if present; otherwise DEFAULT_PROMPT.
+    Accepts the {"customer": {...}} lookup payload or a bare customer dict.
     """
     if not customer_info:
-        return "default"
-    cust = customer_info.get("customer") or {}
-    prompt = cust.get("customer_prompt")
-    return prompt if prompt else "default"
\ No newline at end of file
+        return DEFAULT_PROMPT
+    cust = customer_info.get("customer")
+    if not isinstance(cust, dict):
+        cust = customer_info
+    return cust.get("customer_prompt") or DEFAULT_PROMPT
\ No newline at end of file
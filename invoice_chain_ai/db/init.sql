@@ -28,4 +28,7 @@ CREATE TABLE IF NOT EXISTS addresses (
 ALTER TABLE customers ADD COLUMN IF NOT EXISTS customer_prompt TEXT;
 
 ALTER TABLE customers
-ADD COLUMN IF NOT EXISTS ibans TEXT [] DEFAULT '{}'::text [];
\ No newline at end of file
+ADD COLUMN IF NOT EXISTS ibans TEXT [] DEFAULT '{}'::text [];
+
+-- GIN index for IBAN lookups (ibans @> ARRAY[...])
+CREATE INDEX IF NOT EXISTS customers_ibans_gin ON customers USING GIN (ibans);
\ No newline at end of file
@@ -1,40 +1,244 @@
 from __future__ import annotations
 from pathlib import Path
+import json
+import mmap
+import os
 import shutil
+import sys
 import re
-from typing import Optional
+import threading
+
+try:
+    import hyperscan
+except Exception:
+    hyperscan = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _dumps(obj) -> bytes:
+    """Indented UTF-8 JSON bytes (orjson when installed) for the files written to run_dir."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+# Rough regex to find CH + 2 digits plus following characters (allow spaces)
+# We'll normalize and validate length afterwards.
+_IBAN_RE = re.compile(r"\bCH[\s\dA-Za-z]{10,30}\b", re.IGNORECASE)
+_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
+# _IBAN_RE is case-insensitive, so a file can only match if it contains one of these
+_CH_TOKENS = (b"CH", b"ch", b"Ch", b"cH")
+
+# Chunked scan settings: the overlap must exceed the longest possible _IBAN_RE match (32 chars).
+_SCAN_CHUNK_SIZE = 1 << 16
+_SCAN_OVERLAP = 64
+
+# Markdown tokens found by scan_markdown_tokens (all case-insensitive). TOKEN_INVOICE_TERM
+# covers the amount/quantity/meter/period/date words structured-output pruning keeps blocks for.
+# The patterns avoid \b: Hyperscan rejects it in UCP mode, which is needed for \d, \s and
+# non-ASCII case folding to behave as in Python's re.
+TOKEN_SPC, TOKEN_VAT_ID, TOKEN_IBAN_NUMBER, TOKEN_IBAN, TOKEN_MWST, TOKEN_INVOICE_TERM = range(6)
+_MARKDOWN_TOKENS = (
+    (TOKEN_SPC, r"SPC"),
+    (TOKEN_VAT_ID, r"CHE-\d{3}\.\d{3}\.\d{3}"),
+    # the prefix of every IBAN find_iban_in_markdown can return: CH, then two digits once
+    # whitespace (any amount) is dropped
+    (TOKEN_IBAN_NUMBER, r"CH\s*\d\s*\d"),
+    (TOKEN_IBAN, r"IBAN"),
+    (TOKEN_MWST, r"MWST"),
+    (TOKEN_INVOICE_TERM,
+     r"CHF|TVA|IVA|Total|Betrag|Montant|Importo|Menge|Quantit|kW|m3|m³"
+     r"|Rechnung|Facture|Fattura|Zähler|Compteur|Contatore|Periode|Période|Periodo"
+     r"|\d{2}\.\d{2}\.\d{4}"),
+)
+ALL_MARKDOWN_TOKENS = frozenset(tid for tid, _ in _MARKDOWN_TOKENS)
+_MARKDOWN_TOKEN_RES = tuple((tid, re.compile(pattern, re.IGNORECASE)) for tid, pattern in _MARKDOWN_TOKENS)
+# re fallback: a zero-width lookahead alternation stops at every position where some token
+# starts, so tokens overlapping an earlier match are still seen, as with Hyperscan
+_MARKDOWN_TOKENS_RE = re.compile(
+    "|".join(f"(?=(?:{pattern}))" for _, pattern in _MARKDOWN_TOKENS), re.IGNORECASE
+)
+_hs_db = None
+_hs_db_lock = threading.Lock()
+# scratch space can't be shared by concurrent scans; each thread allocates its own
+_hs_local = threading.local()
+
+# Linux ioctl for copy-on-write clones (Btrfs/XFS); see ioctl_ficlone(2)
+_FICLONE = 0x40049409
 
 def unique_outdir(base_outdir: Path, pdf_path: Path) -> Path:
     # Use parent folder name and PDF stem for output folder
     parent_name = pdf_path.parent.name
     pdf_stem = pdf_path.stem
     folder_name = f"{parent_name}_{pdf_stem}"
-    candidate = base_outdir / folder_name
-    if not candidate.exists():
-        return candidate
-    i = 2
-    while True:
-        candidate = base_outdir / f"{folder_name}_{i}"
-        if not candidate.exists():
-            return candidate
-        i += 1
+    # One directory listing instead of an exists() probe per earlier run
+    try:
+        existing = {p.name for p in base_outdir.iterdir()}
+    except FileNotFoundError:
+        existing = set()
+    if folder_name not in existing:
+        return base_outdir / folder_name
+    prefix = folder_name + "_"
+    suffixes = (n[len(prefix):] for n in existing if n.startswith(prefix))
+    # isdigit() alone accepts digits int() rejects (e.g. "²")
+    max_i = max((int(s) for s in suffixes if s.isascii() and s.isdigit()), default=1)
+    return base_outdir / f"{folder_name}_{max_i + 1}"
+
+def _clone_file(src: Path, dest: Path) -> bool:
+    """Try a copy-on-write clone of src to dest; False if the platform/filesystem can't."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        # opening dest truncates it: leave src == dest to copyfile, which raises SameFileError
+        if os.path.exists(dest) and os.path.samefile(src, dest):
+            return False
+        import fcntl
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
 
 def copy_pdf_to_run(pdf_path: Path, run_dir: Path) -> Path:
     dest = run_dir / pdf_path.name
     try:
-        shutil.copy2(pdf_path, dest)
+        # Reflink where supported, else copyfile (which uses sendfile/fcopyfile
+        # kernel-side copies); copystat keeps copy2's metadata semantics.
+        if not _clone_file(pdf_path, dest):
+            shutil.copyfile(pdf_path, dest)
+        shutil.copystat(pdf_path, dest)
     except Exception:
         # Keep original error handling in callers if needed
         raise
     return dest
 
+def atomic_write(path: Path, data: bytes | str) -> None:
+    """
+    Write data (str as UTF-8 text) to a hidden temp file next to path and rename it over path:
+    readers never see a partially written file, and a failure leaves neither a truncated target
+    nor the temp file behind.
+    """
+    tmp_file = path.with_name(f".{path.name}.tmp")
+    try:
+        if isinstance(data, str):
+            tmp_file.write_text(data, encoding="utf-8")
+        else:
+            tmp_file.write_bytes(data)
+        os.replace(tmp_file, path)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
 def write_markdown(run_dir: Path, pdf_stem: str, engine: str, markdown: str) -> Path:
     out_file = run_dir / f"{pdf_stem}.{engine}.md"
-    out_file.write_text(markdown, encoding="utf-8")
+    # the QR heuristic globs *.md, so it must never see a partially written file
+    atomic_write(out_file, markdown)
     return out_file
 
+def _scan_windows(path: Path, size: int = _SCAN_CHUNK_SIZE, overlap: int = _SCAN_OVERLAP):
+    """
+    Yield (text, start, stop) windows over a text file read in chunks. A window owns the
+    matches starting in [start, stop); its last `overlap` chars (plus one char of
+    look-behind for \\b) are carried into the next window, so short matches never split.
+    Small files are yielded as a single window.
+    """
+    if path.stat().st_size <= size:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        yield text, 0, len(text)
+        return
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        carry = ""
+        while True:
+            buf = f.read(size)
+            text = carry + buf
+            start = 1 if carry else 0
+            if not buf:
+                if len(text) > start:
+                    yield text, start, len(text)
+                return
+            stop = max(start, len(text) - overlap)
+            yield text, start, stop
+            carry = text[stop - 1:]
+
+def _may_contain_iban(path: Path) -> bool:
+    """Byte-level pre-check (mmap + find, i.e. C memmem) before engaging the regex."""
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return any(mm.find(tok) != -1 for tok in _CH_TOKENS)
+
+def _hyperscan_db():
+    global _hs_db
+    with _hs_db_lock:
+        if _hs_db is None:
+            db = hyperscan.Database()
+            db.compile(
+                expressions=[pattern.encode("utf-8") for _, pattern in _MARKDOWN_TOKENS],
+                ids=[tid for tid, _ in _MARKDOWN_TOKENS],
+                flags=[
+                    hyperscan.HS_FLAG_CASELESS
+                    | hyperscan.HS_FLAG_UTF8
+                    | hyperscan.HS_FLAG_UCP
+                    | hyperscan.HS_FLAG_SINGLEMATCH
+                ]
+                * len(_MARKDOWN_TOKENS),
+            )
+            _hs_db = db
+    return _hs_db
+
+def _scan_with_hyperscan(data: bytes, wanted: frozenset[int] | None) -> set[int]:
+    db = _hyperscan_db()
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(db)
+    found: set[int] = set()
+
+    def on_match(tid, start, end, flags, context):
+        found.add(tid)
+        # a truthy return stops the scan
+        return wanted is not None and tid in wanted
+
+    try:
+        db.scan(data, match_event_handler=on_match, scratch=scratch)
+    except hyperscan.ScanTerminated:
+        pass
+    return found
+
+def _scan_with_re(text: str, wanted: frozenset[int] | None) -> set[int]:
+    found: set[int] = set()
+    for m in _MARKDOWN_TOKENS_RE.finditer(text):
+        pos = m.start()
+        # several tokens can start at the same position
+        for tid, pattern in _MARKDOWN_TOKEN_RES:
+            if tid not in found and pattern.match(text, pos):
+                found.add(tid)
+                if wanted is not None and tid in wanted:
+                    return found
+        if len(found) == len(_MARKDOWN_TOKEN_RES):
+            break
+    return found
+
+def scan_markdown_tokens(md: str | bytes, wanted: frozenset[int] | None = None) -> set[int]:
+    """
+    Return the TOKEN_* ids occurring in md, found in one pass over the text (Hyperscan when
+    installed, otherwise a combined regex). With wanted, the scan stops at the first of those
+    ids, so the result is only complete enough to test membership of wanted.
+    """
+    if not md:
+        return set()
+    if hyperscan is not None:
+        return _scan_with_hyperscan(md.encode("utf-8") if isinstance(md, str) else md, wanted)
+    return _scan_with_re(md.decode("utf-8", errors="replace") if isinstance(md, bytes) else md, wanted)
+
 # New: heuristic IBAN extraction from markdown files in an output folder
-def find_iban_in_markdown(output_dir: Path) -> Optional[str]:
+def find_iban_in_markdown(output_dir: Path) -> str | None:
     """
     Scan markdown files in output_dir for a Swiss IBAN. Returns normalized IBAN (no spaces)
     if found, otherwise None. Handles IBANs with or without spaces and common markdown noise.
@@ -47,27 +251,32 @@ def find_iban_in_markdown(output_dir: Path) -> Optional[str]:
     if not md_files:
         return None
 
-    # Rough regex to find CH + 2 digits plus following characters (allow spaces)
-    # We'll normalize and validate length afterwards.
-    pattern = re.compile(r"\bCH[\s\dA-Za-z]{10,30}\b", flags=re.IGNORECASE)
-
     for md in md_files:
         try:
-            text = md.read_text(encoding="utf-8", errors="ignore")
+            if not _may_contain_iban(md):
+                continue
+            iban = _find_iban_in_windows(_scan_windows(md))
+            if iban:
+                return iban
         except Exception:
             continue
-        for m in pattern.findall(text):
-            # Normalize: remove non-alphanumeric characters and uppercase
-            clean = re.sub(r"[^A-Za-z0-9]", "", m).upper()
-            # Validate Swiss IBAN length (Switzerland total IBAN length is 21 characters)
-            if not clean.startswith("CH"):
-                continue
-            if len(clean) == 21 and clean[2:4].isdigit():
-                # Found a plausible Swiss IBAN
-                return clean
-            # Some OCR or input errors produce grouped digits; as a fallback,
-            # if result contains many digits and length close to expected, accept.
-            if len(clean) >= 19 and len(clean) <= 25 and clean[2:4].isdigit():
-                return clean
     # No IBAN found
     return None
+
+def _find_iban_in_windows(windows) -> str | None:
+    for text, start, stop in windows:
+        for m in _IBAN_RE.finditer(text, start):
+            if m.start() >= stop:
+                break
+            # Normalize: the match is whitespace + alphanumerics and always starts
+            # with "CH" (any case), so dropping whitespace is enough; only non-ASCII
+            # digits (rare) need the regex strip.
+            clean = "".join(m.group().split())
+            if not clean.isascii():
+                clean = _NON_ALNUM_RE.sub("", clean)
+            clean = clean.upper()
+            # Swiss IBANs are 21 chars; OCR or grouping noise can shift that, so
+            # accept lengths close to expected as long as the check digits are digits.
+            if 19 <= len(clean) <= 25 and clean[2:4].isdigit():
+                return clean
+    return None
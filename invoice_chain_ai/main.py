@@ -14,95 +14,116 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-try:
-    from .db.db_client import (
-        init_db,
-        get_customer_by_invoice,
-        get_customer_by_iban,
-        get_customer_by_name_city,
-        seed_customers_from_json,
-        choose_prompt,
-    )
-except Exception:
-    # Fallbacks when db package or psycopg isn't available
-    def init_db():
-        return {"status": "noop", "reason": "db package not available"}
-
-    def get_customer_by_invoice(_):
-        return None
-
-    def get_customer_by_iban(_):
-        return None
-
-    def get_customer_by_name_city(_, __=None):
-        return None
-
-    def seed_customers_from_json(_):
-        return {"error": "db package not available"}
-
-    def choose_prompt(_):
-        return "default"
-
-from .cli import run_cli
-
 # New imports
+import importlib
 import os
 from pathlib import Path
 
-# Try to import helpers; keep fallbacks if unavailable
-try:
-	from .io_utils import unique_outdir, copy_pdf_to_run
-	from .qr import scan_qr_code
-except Exception:
-	unique_outdir = None
-	copy_pdf_to_run = None
-	scan_qr_code = None
+# DB/CLI/QR helpers are imported on first use (PEP 562 __getattr__, or _resolve inside main),
+# so importing this module - e.g. for _parse_flags - stays cheap. name -> (module, attribute)
+_LAZY_ATTRS = {
+	"init_db": (".db.db_client", "init_db"),
+	"get_customer_by_invoice": (".db.db_client", "get_customer_by_invoice"),
+	"get_customer_by_iban": (".db.db_client", "get_customer_by_iban"),
+	"seed_customers_from_json": (".db.db_client", "seed_customers_from_json"),
+	"choose_prompt": (".db.db_client", "choose_prompt"),
+	"run_cli": (".cli", "run_cli"),
+	"unique_outdir": (".io_utils", "unique_outdir"),
+	"copy_pdf_to_run": (".io_utils", "copy_pdf_to_run"),
+	"scan_qr_code": (".qr", "scan_qr_code"),
+}
+
+# Used when the import fails: no-op DB functions when the db package or psycopg isn't
+# available, None for the optional run-dir/QR helpers. run_cli has no fallback.
+_FALLBACKS = {
+	"init_db": lambda: {"status": "noop", "reason": "db package not available"},
+	"get_customer_by_invoice": lambda _: None,
+	"get_customer_by_iban": lambda _: None,
+	"seed_customers_from_json": lambda _: {"error": "db package not available"},
+	"choose_prompt": lambda _: "default",
+	"unique_outdir": None,
+	"copy_pdf_to_run": None,
+	"scan_qr_code": None,
+}
+
+# db_client has no name/city lookup; main has always exposed this as a no-op
+def get_customer_by_name_city(_, __=None):
+	return None
+
+def _resolve(name: str):
+	"""Import a lazy attribute once and cache it in the module globals."""
+	g = globals()
+	if name in g:
+		return g[name]
+	module, attr = _LAZY_ATTRS[name]
+	try:
+		value = getattr(importlib.import_module(module, __package__), attr)
+	except Exception:
+		if name not in _FALLBACKS:
+			raise
+		value = _FALLBACKS[name]
+	g[name] = value
+	return value
+
+def __getattr__(name: str):
+	if name in _LAZY_ATTRS:
+		return _resolve(name)
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _parse_flags(argv: list[str]) -> tuple[str | None, bool]:
+	"""
+	Single pass over argv returning (parser value, --qr present).
+	Supports '--parser value' and '--parser=value'; the first --parser wins.
+	"""
+	parser_val = None
+	qr_flag = False
+	n = len(argv)
+	for i, t in enumerate(argv):
+		if t == "--qr":
+			qr_flag = True
+		elif parser_val is None:
+			if t.startswith("--parser="):
+				parser_val = t.split("=", 1)[1].lower()
+			elif t == "--parser" and i + 1 < n:
+				parser_val = str(argv[i + 1]).lower()
+	return parser_val, qr_flag
 
 def _get_parser_option(argv: list[str]) -> str | None:
 	"""Extract --parser value support '--parser value' and '--parser=value'"""
-	if not argv:
-		return None
-	i = 0
-	while i < len(argv):
-		t = argv[i]
-		if t.startswith("--parser="):
-			return t.split("=", 1)[1].lower()
-		if t == "--parser" and i + 1 < len(argv):
-			return str(argv[i + 1]).lower()
-		i += 1
-	return None
+	return _parse_flags(argv or [])[0]
 
 def main(argv: list[str] | None = None) -> int:
 	# First: run the CLI (this should perform PDF -> markdown extraction if CLI is used that way)
-	exit_code = run_cli(argv)
+	exit_code = _resolve("run_cli")(argv)
 
 	# Decide if heuristic fallback is allowed based on argv
 	allowed_parsers = {"marker", "docling", "all"}
-	parser_opt = _get_parser_option(argv or [])
-	use_heuristic = False
-	if parser_opt and parser_opt in allowed_parsers:
-		use_heuristic = True
-	if argv and "--qr" in argv:
-		# explicit --qr also enables heuristic fallback per request
-		use_heuristic = True
+	parser_opt, qr_flag = _parse_flags(argv or [])
+	# explicit --qr also enables heuristic fallback per request
+	use_heuristic = qr_flag or parser_opt in allowed_parsers
 
 	# Then: if a PDF path was supplied as the first positional arg, run the QR scanner
 	try:
 		if argv and len(argv) > 0:
 			first = argv[0]
 			pdf_path = Path(first)
-			if pdf_path.exists() and pdf_path.suffix.lower() == ".pdf" and unique_outdir and copy_pdf_to_run and scan_qr_code:
-				# Determine base output dir from env or default
-				base_out = Path(os.environ.get("OUTPUT_DIR", "./runs"))
-				run_dir = unique_outdir(base_out, pdf_path)
-				run_dir.mkdir(parents=True, exist_ok=True)
-				copied = copy_pdf_to_run(pdf_path, run_dir)
-				# Call QR scanner (pass whether heuristic fallback should be used)
-				try:
-					result = scan_qr_code(copied, run_dir, use_heuristic=use_heuristic)
-					print("QR scan result:", result)
-				except Exception as e:
-					print("QR scanning failed:", e)
+			if pdf_path.exists() and pdf_path.suffix.lower() == ".pdf":
+				# the run-dir/QR helpers (qr.py pulls in PyMuPDF/OpenCV) are only imported for a PDF argument
+				unique_outdir = _resolve("unique_outdir")
+				copy_pdf_to_run = _resolve("copy_pdf_to_run")
+				scan_qr_code = _resolve("scan_qr_code")
+				if unique_outdir and copy_pdf_to_run and scan_qr_code:
+					# Determine base output dir from env or default
+					base_out = Path(os.environ.get("OUTPUT_DIR", "./runs"))
+					run_dir = unique_outdir(base_out, pdf_path)
+					run_dir.mkdir(parents=True, exist_ok=True)
+					copied = copy_pdf_to_run(pdf_path, run_dir)
+					# Call QR scanner (pass whether heuristic fallback should be used)
+					try:
+						result = scan_qr_code(copied, run_dir, use_heuristic=use_heuristic)
+						print("QR scan result:", result)
+					except Exception as e:
+						print("QR scanning failed:", e)
 	except Exception:
 		# Do not fail the whole process if post-processing is not possible
 		pass
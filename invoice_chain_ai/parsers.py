@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Literal
 import shutil  # added
@@ -18,6 +20,8 @@ from marker.services.openai import OpenAIService
 
 Engine = Literal["docling", "marker"]
 
+OCR_LANGS = ("de", "it", "fr")
+
 @traceable(name="Convert PDF to Markdown")
 def convert_pdf_to_markdown(
     pdf_path: Path, engine: Engine, *, use_llm: bool = False, output_dir: Path
@@ -33,31 +37,42 @@ def convert_pdf_to_markdown(
         raise ValueError(f"Unknown engine: {engine}")
 
 
-@traceable(name="Docling PDF Conversion")
-def _convert_with_docling(pdf_path: Path) -> str:
-    """Convert PDF to markdown using docling."""
+@functools.lru_cache(maxsize=4)
+def _get_docling_converter(ocr_langs: tuple[str, ...]) -> DocumentConverter:
+    """Build (once per language set and process) a docling converter."""
     # Prefer OCR language config if supported by your docling version
     pipeline_options = PdfPipelineOptions()
-    pipeline_options.ocr_options.lang = ["de", "it", "fr"]
+    pipeline_options.ocr_options.lang = list(ocr_langs)
 
     try:
         # Newer API: constructor accepts pipeline_options
-        converter = DocumentConverter(pipeline_options=pipeline_options)
-        result = converter.convert(str(pdf_path))
-
+        return DocumentConverter(pipeline_options=pipeline_options)
     except TypeError:
         # Older API: no pipeline_options support -> fall back without options
-        converter = DocumentConverter()
-        result = converter.convert(str(pdf_path))
+        return DocumentConverter()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_marker_artifacts() -> dict:
+    """Load marker's model weights once per process."""
+    return create_model_dict()
 
+
+@traceable(name="Docling PDF Conversion")
+def _convert_with_docling(pdf_path: Path, converter: DocumentConverter | None = None) -> str:
+    """Convert PDF to markdown using docling. Pass `converter` to reuse loaded models."""
+    if converter is None:
+        converter = _get_docling_converter(OCR_LANGS)
+    result = converter.convert(str(pdf_path))
     return result.document.export_to_markdown()
 
 
 @traceable(name="Marker PDF Conversion")
 def _convert_with_marker(
-    pdf_path: Path, use_llm: bool = False, output_dir: Path = None
+    pdf_path: Path, use_llm: bool = False, output_dir: Path = None, artifact_dict: dict | None = None
 ) -> str:
-    """Convert PDF using Marker with optional LLM. Images are stored in output_dir/images after conversion if provided."""
+    """Convert PDF using Marker with optional LLM. Images are stored in output_dir/images after conversion if provided.
+    Pass `artifact_dict` (from create_model_dict()) to reuse loaded models."""
 
     config = {
         "output_format": "markdown",
@@ -85,7 +100,7 @@ def _convert_with_marker(
 
     converter = PdfConverter(
         config=config_parser.generate_config_dict(),
-        artifact_dict=create_model_dict(),
+        artifact_dict=artifact_dict if artifact_dict is not None else _get_marker_artifacts(),
         processor_list=config_parser.get_processors(),
         renderer=config_parser.get_renderer(),
         llm_service=config_parser.get_llm_service(),
@@ -97,7 +112,16 @@ def _convert_with_marker(
     if images:
         images_dir = output_dir / "images"
         images_dir.mkdir(parents=True, exist_ok=True)
-        for filename, img in images.items():
-            img.save(images_dir / filename)
+        # PIL's encoders release the GIL, so saving in threads scales with cores
+        with ThreadPoolExecutor(max_workers=min(8, len(images))) as ex:
+            list(ex.map(lambda item: _save_image(item[1], images_dir / item[0]), images.items()))
 
     return text
+
+
+def _save_image(img, path: Path) -> None:
+    # These are intermediate artifacts: skip the expensive zlib levels for PNG
+    if path.suffix.lower() == ".png":
+        img.save(path, optimize=False, compress_level=1)
+    else:
+        img.save(path)
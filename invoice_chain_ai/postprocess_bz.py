@@ -1,88 +1,97 @@
 from __future__ import annotations
+import asyncio
+import functools
+import hashlib
+import io
 import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, FrozenSet, List, Set
 
 from langsmith import traceable
 
 from .bz_mapping import BZ_MAPPING
-from .structured_output import run_structured_output_modern
+from .io_utils import _dumps, _loads
+from .structured_output import (
+	create_chat_model,
+	llm_settings,
+	run_structured_output_modern,
+	run_structured_output_modern_async,
+)
 
-@traceable(name="BZArt Enrichment")
-def enrich_bz_art(raw_structured_path: Path, run_dir: Path) -> Dict[str, Any]:
-	"""
-	Load raw structured output JSON, build a language-aware prompt filtered by quantity units,
-	call the LLM, and enrich each line item with a 'BZArt' value. Write enriched JSON back.
-	"""
-	# load raw structured JSON
-	raw = json.loads(raw_structured_path.read_text(encoding="utf-8"))
-
-	# 1) extract invoice language (try common keys)
-	invoice_language = (
-		raw.get("invoice_language")
-		or raw.get("language")
-		or (raw.get("header") or {}).get("invoice_language")
-		or (raw.get("header") or {}).get("language")
-		or "de"
-	)
-	lang = invoice_language.lower()[:2]  # 'de','fr','it' fallback
 
-	# 2) collect quantity units from each line item (include empty string / null)
-	units: Set[str] = set()
-	line_items = raw.get("line_items", []) or []
-	for li in line_items:
-		q = li.get("quantity_unit")
-		if q is None:
-			q = ""
-		units.add(str(q))
-
-	# 3) filter BZ_MAPPING entries by unit_quantity matching the collected units
-	filtered = []
-	for entry in BZ_MAPPING:
-		unit = (entry.get("unit_quantity") or "")
-		if unit in units:
-			# build a reduced entry keeping only the description in the invoice language
-			desc = ""
-			if lang == "fr":
-				desc = entry.get("description_fr") or entry.get("description_de") or entry.get("description_it") or ""
-			elif lang == "it":
-				desc = entry.get("description_it") or entry.get("description_de") or entry.get("description_fr") or ""
-			else:
-				desc = entry.get("description_de") or entry.get("description_fr") or entry.get("description_it") or ""
-			filtered.append({
-				"bz_art": entry.get("bz_art"),
-				"type": entry.get("type"),
-				"unit_quantity": unit,
-				"price_unit": entry.get("price_unit"),
-				"description": desc,
-				"description_de": entry.get("description_de"),
-				"description_fr": entry.get("description_fr"),
-				"description_it": entry.get("description_it"),
-			})
-
-	# 4) build prompt text (reference mapping + examples + line items). Keep it compact.
-	prompt_lines: List[str] = []
-	prompt_lines.append("# TASK")
-	prompt_lines.append("Given an energy bill line item details, determine the correct 'BZArt' (Bezugszeilenart) from the following options.")
-	prompt_lines.append("Consider description, quantity_unit and category. Return a JSON array of BZArt values in the same order as the line items.")
-	prompt_lines.append("\n#Reference mapping:")
-	for entry in filtered:
-		prompt_lines.append(f"BZArt: {entry['bz_art']}")
-		if entry["type"] and entry["type"] != "NULL":
-			prompt_lines.append(f"Type: {entry['type']}")
-		prompt_lines.append(f"Unit Quantity: {entry['unit_quantity']}")
-		prompt_lines.append(f"Price Unit: {entry['price_unit']}")
-		# only include the single-language description plus the other language descs for context
-		prompt_lines.append(f"- Description ({invoice_language}): {entry['description']}")
-		# also include the other language descriptions for better matching
-		prompt_lines.append(f"- German: {entry.get('description_de','')}")
-		prompt_lines.append(f"- French: {entry.get('description_fr','')}")
-		prompt_lines.append(f"- Italian: {entry.get('description_it','')}")
-		prompt_lines.append("-------------------")
+def _render_head(entry: Dict[str, Any]) -> str:
+	lines = [f"BZArt: {entry.get('bz_art')}"]
+	if entry.get("type") and entry.get("type") != "NULL":
+		lines.append(f"Type: {entry.get('type')}")
+	lines.append(f"Unit Quantity: {entry.get('unit_quantity') or ''}")
+	lines.append(f"Price Unit: {entry.get('price_unit')}")
+	return "\n".join(lines)
+
+
+def _render_tail(entry: Dict[str, Any]) -> str:
+	# also include the other language descriptions for better matching
+	return "\n".join((
+		f"- German: {entry.get('description_de')}",
+		f"- French: {entry.get('description_fr')}",
+		f"- Italian: {entry.get('description_it')}",
+		"-------------------",
+	))
+
+
+# BZ_MAPPING as parallel columns (row i of each list is BZ_MAPPING[i]): the pre-rendered
+# prompt lines around the description, and the description per invoice language with
+# fallback to the other languages.
+_DE = [e.get("description_de") for e in BZ_MAPPING]
+_FR = [e.get("description_fr") for e in BZ_MAPPING]
+_IT = [e.get("description_it") for e in BZ_MAPPING]
+_BZ_HEAD = [_render_head(e) for e in BZ_MAPPING]
+_BZ_TAIL = [_render_tail(e) for e in BZ_MAPPING]
+_BZ_DESC = {
+	"de": [de or fr or it or "" for de, fr, it in zip(_DE, _FR, _IT)],
+	"fr": [fr or de or it or "" for de, fr, it in zip(_DE, _FR, _IT)],
+	"it": [it or de or fr or "" for de, fr, it in zip(_DE, _FR, _IT)],
+}
+del _DE, _FR, _IT
+
+# unit_quantity -> row indices into the columns above
+_BZ_ROWS_BY_UNIT: Dict[str, List[int]] = {}
+for _i, _entry in enumerate(BZ_MAPPING):
+	_BZ_ROWS_BY_UNIT.setdefault(_entry.get("unit_quantity") or "", []).append(_i)
+del _i, _entry
+
+
+# where the invoice language may live in the structured output, in priority order
+_LANG_KEYS = (
+	("invoice_language",),
+	("language",),
+	("header", "invoice_language"),
+	("header", "language"),
+)
+
+
+def _dig(d: Any, path: tuple) -> Any:
+	for k in path:
+		d = d.get(k) if isinstance(d, dict) else None
+	return d
+
+# one reference-mapping block per entry; the description line carries the invoice language
+_ENTRY_TEMPLATE = "\n{head}\n- Description ({language}): {description}\n{tail}"
+
+# static parts of the BZArt prompt, around the per-invoice reference mapping
+_PROMPT_HEAD = "\n".join((
+	"# TASK",
+	"Given an energy bill line item details, determine the correct 'BZArt' (Bezugszeilenart) from the following options.",
+	"Consider description, quantity_unit and category. Return a JSON array of BZArt values in the same order as the line items.",
+	"",
+	"#Reference mapping:",
+))
+_PROMPT_EXAMPLES = """
 
-	# add compact examples
-	prompt_lines.append(
-		"""
 # Examples (line item description -> BZArt):
 - "Arbeit Hochtarif" -> "HT"
 - "Arbeit Niedertarif" -> "NT"
@@ -95,84 +104,436 @@ def enrich_bz_art(raw_structured_path: Path, run_dir: Path) -> Dict[str, Any]:
 - "Abgaben und Leistungen an die Gemeinde" -> "SA_L"
 - "Stromreserve" -> "ERA_M"
 """
-	)
 
-	# prepare the items to be classified
-	prompt_lines.append("\nFor the following line items, return ONLY a JSON array of BZArt values (strings) in the same order. If no match is found for a line item, return \"UNKNOWN\" for that position.\n")
-	prompt_lines.append("# Line item details:")
+# instructions between the reference block and the line items, for one invoice / for a batch
+_ITEMS_INSTRUCTIONS = "\n\nFor the following line items, return ONLY a JSON array of BZArt values (strings) in the same order. If no match is found for a line item, return \"UNKNOWN\" for that position.\n\n# Line item details:"
+_BATCH_INSTRUCTIONS = (
+	"\n\nThe line items below belong to several invoices. Return ONLY a JSON object with the keys "
+	"\"invoice_1\", \"invoice_2\", ... (one per invoice, numbered as below); each value is a JSON array "
+	"of BZArt values (strings) in the same order as that invoice's line items. If no match is found "
+	"for a line item, return \"UNKNOWN\" for that position.\n"
+)
+
+@functools.lru_cache(maxsize=64)
+def _build_bz_reference(invoice_language: str, units_key: FrozenSet[str]) -> str:
+	"""
+	Task description, reference mapping and examples of the BZArt prompt. They only depend on
+	the invoice language and the set of quantity units, so invoices sharing both reuse one string.
+	"""
+	# look up BZ_MAPPING entries by unit_quantity; keep mapping order in the prompt
+	rows: List[int] = []
+	for u in units_key:
+		rows.extend(_BZ_ROWS_BY_UNIT.get(u, ()))
+	rows.sort()
+	lang = invoice_language.lower()[:2]  # 'de','fr','it' fallback
+	desc_col = _BZ_DESC.get(lang, _BZ_DESC["de"])
+
+	# reference mapping + examples. Keep it compact.
+	buf = io.StringIO()
+	buf.write(_PROMPT_HEAD)
+	# only include the single-language description plus the other language descs for context
+	for i in rows:
+		buf.write(_ENTRY_TEMPLATE.format(head=_BZ_HEAD[i], language=invoice_language, description=desc_col[i], tail=_BZ_TAIL[i]))
+
+	# add compact examples
+	buf.write(_PROMPT_EXAMPLES)
+	return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def _build_bz_prefix(invoice_language: str, units_key: FrozenSet[str]) -> str:
+	"""Everything in the single-invoice BZArt prompt before the line items."""
+	return _build_bz_reference(invoice_language, units_key) + _ITEMS_INSTRUCTIONS
+
+# wrapper keys under which the LLM helper may return its answer
+_RESULT_KEYS = ("output", "result", "content", "text", "answer")
+
+
+def _parse_array(text: str) -> List[Any] | None:
+	try:
+		value = _loads(text)
+	except ValueError:
+		return None
+	return value if isinstance(value, list) else None
+
+
+def _from_result_keys(result: Dict[str, Any]) -> List[Any] | None:
+	for k in _RESULT_KEYS:
+		v = result.get(k)
+		if not v:
+			continue
+		found = v if isinstance(v, list) else _parse_array(v) if isinstance(v, str) else None
+		if found is not None:
+			return found
+	return None
+
+
+def _split_codes(text: str) -> List[str]:
+	# not JSON: take one code per non-empty line
+	return [l.strip().strip('"') for l in text.splitlines() if l.strip()]
+
+
+# tried in order on the LLM result; the first one returning a list wins
+_EXTRACTORS = (
+	lambda r: r if isinstance(r, list) else None,
+	lambda r: _parse_array(r) if isinstance(r, str) else None,
+	lambda r: _from_result_keys(r) if isinstance(r, dict) else None,
+	lambda r: _split_codes(r) if isinstance(r, str) else None,
+)
+
+
+def _extract_predictions(llm_result: Any) -> List[str]:
+	"""Pull the list of BZArt codes out of whatever the LLM helper returned."""
+	for extract in _EXTRACTORS:
+		predictions = extract(llm_result)
+		if predictions is not None:
+			# ensure predictions is a list of strings
+			return [str(p) for p in predictions]
+	return []
+
+
+def _extract_batch_predictions(llm_result: Any, count: int) -> List[List[str]]:
+	"""Split a batch answer ({"invoice_1": [...], ...}) into one prediction list per invoice."""
+	payload = llm_result
+	if isinstance(payload, dict) and "invoice_1" not in payload:
+		# the object may be wrapped under one of the usual keys, possibly as a JSON string
+		payload = next((payload[k] for k in _RESULT_KEYS if payload.get(k)), payload)
+	if isinstance(payload, str):
+		try:
+			payload = _loads(payload)
+		except ValueError:
+			payload = None
+	if not isinstance(payload, dict):
+		return [[] for _ in range(count)]
+	out: List[List[str]] = []
+	for k in range(1, count + 1):
+		v = payload.get(f"invoice_{k}")
+		out.append([str(p) for p in v] if isinstance(v, list) else [])
+	return out
+
+
+# On-disk cache of LLM predictions keyed by sha256(model settings + prompt), in the user cache
+# dir by default. Set BZ_CACHE_DB to a path to move it, or to an empty string to disable it.
+def _default_cache_db() -> Path:
+	base = os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+	return Path(base) / "invoice_chain_ai" / "bz_prompt_cache.sqlite3"
+
+_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bz_prompt_cache (
+	prompt_hash BLOB PRIMARY KEY,
+	predictions_json BLOB NOT NULL,
+	created_at INTEGER NOT NULL
+)
+"""
+
+
+# (path, connection) opened once per process; the lock serializes all use of the connection
+_cache_conn: tuple | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_connection() -> sqlite3.Connection | None:
+	"""The process-wide cache connection (call with _CACHE_LOCK held). None when disabled."""
+	global _cache_conn
+	path = os.getenv("BZ_CACHE_DB", str(_default_cache_db()))
+	if _cache_conn is None or _cache_conn[0] != path:
+		if _cache_conn is not None and _cache_conn[1] is not None:
+			_cache_conn[1].close()
+		_cache_conn = None
+		conn = None
+		if path:
+			Path(path).parent.mkdir(parents=True, exist_ok=True)
+			conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+			# WAL lets concurrent processes read while one of them writes
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute(_CACHE_SCHEMA)
+		_cache_conn = (path, conn)
+	return _cache_conn[1]
+
+
+def _prompt_key(prompt_bytes: bytes) -> bytes:
+	# answers depend on the model and its settings as much as on the prompt
+	settings = json.dumps(llm_settings(), sort_keys=True).encode("utf-8")
+	return hashlib.sha256(settings + b"\0" + prompt_bytes).digest()
+
+
+def _cache_get(prompt_hash: bytes) -> Any:
+	try:
+		with _CACHE_LOCK:
+			conn = _cache_connection()
+			if conn is None:
+				return None
+			row = conn.execute(
+				"SELECT predictions_json FROM bz_prompt_cache WHERE prompt_hash = ?", (prompt_hash,)
+			).fetchone()
+		return _loads(row[0]) if row else None
+	except (sqlite3.Error, OSError, ValueError):
+		# the cache is an optimization only; never fail enrichment because of it
+		return None
+
+
+def _cache_put(prompt_hash: bytes, predictions: Any) -> None:
+	try:
+		with _CACHE_LOCK:
+			conn = _cache_connection()
+			if conn is None:
+				return
+			with conn:
+				conn.execute(
+					"INSERT OR REPLACE INTO bz_prompt_cache (prompt_hash, predictions_json, created_at) VALUES (?, ?, ?)",
+					(prompt_hash, json.dumps(predictions, ensure_ascii=False).encode("utf-8"), int(time.time())),
+				)
+	except (sqlite3.Error, OSError):
+		pass
+
+def _load_raw(raw_structured_path: Path) -> Dict[str, Any]:
+	return _loads(raw_structured_path.read_bytes())
+
+
+def _collect_line_items(raw: Dict[str, Any]) -> tuple:
+	"""
+	Return (invoice_language, units, item_lines, line_items): the quantity units (include empty
+	string / null) and each line item's prompt line, rendered in one pass reading every field once.
+	"""
+	# extract invoice language (try common keys)
+	invoice_language = next((v for v in (_dig(raw, p) for p in _LANG_KEYS) if v), "de")
+
+	units: Set[str] = set()
+	item_lines: List[str] = []
+	line_items = raw.get("line_items", []) or []
 	for li in line_items:
-		descr = li.get("line_items_description") or li.get("description") or ""
-		q_unit = li.get("quantity_unit") or ""
-		category = li.get("category") or ""
+		get = li.get
+		q = get("quantity_unit")
+		units.add("" if q is None else str(q))
+		descr = get("line_items_description") or get("description") or ""
+		category = get("category") or ""
 		# include meter_point/VS_Adr if present for context
-		extra = []
-		if li.get("meter_point"):
-			extra.append(f"meter_point={li.get('meter_point')}")
-		if li.get("VS_Adr"):
-			extra.append(f"VS_Adr={li.get('VS_Adr')}")
-		extra_s = (" | " + " ; ".join(extra)) if extra else ""
-		prompt_lines.append(f"- Description: {descr} | quantity_unit: {q_unit} | category: {category}{extra_s}")
+		meter_point = get("meter_point")
+		vs_adr = get("VS_Adr")
+		if meter_point and vs_adr:
+			extra_s = f" | meter_point={meter_point} ; VS_Adr={vs_adr}"
+		elif meter_point:
+			extra_s = f" | meter_point={meter_point}"
+		elif vs_adr:
+			extra_s = f" | VS_Adr={vs_adr}"
+		else:
+			extra_s = ""
+		item_lines.append(f"\n- Description: {descr} | quantity_unit: {q or ''} | category: {category}{extra_s}")
+	return invoice_language, units, item_lines, line_items
+
 
-	prompt_text = "\n".join(prompt_lines)
+def _single_prompt(invoice_language: str, units: Set[str], item_lines: List[str]) -> bytes:
+	# cached reference part, then this invoice's line items
+	buf = io.StringIO()
+	buf.write(_build_bz_prefix(invoice_language, frozenset(units)))
+	buf.write("".join(item_lines))
+	return buf.getvalue().encode("utf-8")
 
-	# write prompt to a temporary md file and call the existing LLM wrapper
+
+def _prepare_prompt(prompt_bytes: bytes, run_dir: Path) -> tuple:
+	"""
+	Write the prompt to run_dir/bz_prompt.md; return (prompt path, cache key, cached predictions
+	or None). Identical prompts (same language, units and line items) reuse cached predictions.
+	"""
 	bz_prompt_md = run_dir / "bz_prompt.md"
-	bz_prompt_md.write_text(prompt_text, encoding="utf-8")
+	bz_prompt_md.write_bytes(prompt_bytes)
+	prompt_hash = _prompt_key(prompt_bytes)
+	return bz_prompt_md, prompt_hash, _cache_get(prompt_hash)
+
+
+def _store_predictions(prompt_hash: bytes, llm_result: Any) -> List[str]:
+	predictions = _extract_predictions(llm_result)
+	if predictions:
+		_cache_put(prompt_hash, predictions)
+	return predictions
+
 
-	# 5) call LLM via the existing helper (re-uses the project's structured output LLM pipeline)
+def _classify(prompt_bytes: bytes, run_dir: Path) -> List[str] | None:
+	"""
+	Predictions for the prompt: from the cache when the identical prompt was seen before, else
+	from the LLM (via the project's structured output pipeline). None if the LLM call failed.
+	"""
+	bz_prompt_md, prompt_hash, predictions = _prepare_prompt(prompt_bytes, run_dir)
+	if predictions is not None:
+		return predictions
 	try:
 		llm_result = run_structured_output_modern(bz_prompt_md, None, run_dir)
-	except Exception as e:
-		# on failure, annotate with UNKNOWN and return raw
-		for li in line_items:
-			li["BZArt"] = "UNKNOWN"
-		out_path = run_dir / "raw_structured_output_enriched.json"
-		out_path.write_text(json.dumps(raw, ensure_ascii=False, indent=2), encoding="utf-8")
-		return raw
+	except Exception:
+		return None
+	return _store_predictions(prompt_hash, llm_result)
+
+
+async def _classify_async(prompt_bytes: bytes, run_dir: Path, llm: Any = None) -> List[str] | None:
+	"""Like _classify, but awaits the LLM so several invoices can wait on the network together."""
+	bz_prompt_md, prompt_hash, predictions = _prepare_prompt(prompt_bytes, run_dir)
+	if predictions is not None:
+		return predictions
+	try:
+		llm_result = await run_structured_output_modern_async(bz_prompt_md, None, run_dir, llm=llm)
+	except Exception:
+		return None
+	return _store_predictions(prompt_hash, llm_result)
 
-	# llm_result might be dict or string; try to extract JSON array
-	predictions: List[str] = []
-	if isinstance(llm_result, dict):
-		# try common keys
-		for k in ("output", "result", "content", "text", "answer"):
-			v = llm_result.get(k)
-			if v:
-				try:
-					predictions = json.loads(v) if isinstance(v, str) else v
-					break
-				except Exception:
-					# not JSON, try as string of array
-					try:
-						predictions = json.loads(str(v))
-						break
-					except Exception:
-						continue
-		# fallback: use the dict itself if it's a list-like under 'predictions'
-		if not predictions:
-			if isinstance(llm_result, list):
-				predictions = llm_result  # type: ignore
-	elif isinstance(llm_result, str):
-		# try to parse a JSON array from string
-		try:
-			predictions = json.loads(llm_result)
-		except Exception:
-			# fallback: split lines and take tokens that look like codes
-			lines = [l.strip().strip('"') for l in llm_result.splitlines() if l.strip()]
-			# attempt to pick tokens that look like bz_art codes
-			predictions = lines
 
-	# ensure predictions is a list of strings
-	predictions = [str(p) for p in (predictions or [])]
+_STATUS_FILE = "bz_art_status.txt"
 
-	# 6) enrich raw line items
+
+def _mark_failed(raw: Dict[str, Any], line_items: list, run_dir: Path) -> None:
+	# annotate the items with UNKNOWN, in the returned dict and the enriched file alike;
+	# bz_art_status.txt marks the run as not enriched (until a later run succeeds)
+	for li in line_items:
+		li["BZArt"] = "UNKNOWN"
+	(run_dir / "raw_structured_output_enriched.json").write_bytes(_dumps(raw))
+	(run_dir / _STATUS_FILE).write_bytes(b"failed\n")
+
+
+def _copy_unenriched(raw_structured_path: Path, run_dir: Path) -> None:
+	# no line items: the enriched file is a plain copy of the input (no re-serialization)
+	shutil.copyfile(raw_structured_path, run_dir / "raw_structured_output_enriched.json")
+	(run_dir / _STATUS_FILE).unlink(missing_ok=True)
+
+
+def _apply_predictions(raw: Dict[str, Any], line_items: list, predictions: List[str], run_dir: Path) -> None:
+	# enrich raw line items
 	for idx, li in enumerate(line_items):
 		if idx < len(predictions) and predictions[idx]:
 			li["BZArt"] = predictions[idx]
 		else:
 			li["BZArt"] = "UNKNOWN"
 
-	# write enriched file
+	# write enriched file; a failure marker from an earlier run no longer applies
 	out_path = run_dir / "raw_structured_output_enriched.json"
-	out_path.write_text(json.dumps(raw, ensure_ascii=False, indent=2), encoding="utf-8")
+	out_path.write_bytes(_dumps(raw))
+	(run_dir / _STATUS_FILE).unlink(missing_ok=True)
+
+@traceable(name="BZArt Enrichment")
+def enrich_bz_art(raw_structured_path: Path, run_dir: Path) -> Dict[str, Any]:
+	"""
+	Load raw structured output JSON, build a language-aware prompt filtered by quantity units,
+	call the LLM, and enrich each line item with a 'BZArt' value. Write enriched JSON back.
+	"""
+	raw = _load_raw(raw_structured_path)
+	invoice_language, units, item_lines, line_items = _collect_line_items(raw)
+	if not line_items:
+		# nothing to classify (and no units): skip the prompt and the LLM round-trip
+		_copy_unenriched(raw_structured_path, run_dir)
+		return raw
+
+	predictions = _classify(_single_prompt(invoice_language, units, item_lines), run_dir)
+	if predictions is None:
+		_mark_failed(raw, line_items, run_dir)
+		return raw
+
+	_apply_predictions(raw, line_items, predictions, run_dir)
+	return raw
+
+@traceable(name="BZArt Batch Enrichment")
+def enrich_bz_art_batch(raw_structured_paths: List[Path], run_dirs: List[Path]) -> List[Dict[str, Any]]:
+	"""
+	Enrich several invoices like enrich_bz_art, but with one LLM call per group of invoices
+	sharing language and quantity units, so the reference mapping is sent once per group.
+	The batch prompt is written to the first run_dir of each group as bz_prompt_batch.md.
+	"""
+	if len(raw_structured_paths) != len(run_dirs):
+		raise ValueError("raw_structured_paths and run_dirs must have the same length")
+
+	results: List[Dict[str, Any]] = []
+	groups: Dict[tuple, List[tuple]] = {}
+	for path, run_dir in zip(raw_structured_paths, run_dirs):
+		raw = _load_raw(path)
+		results.append(raw)
+		invoice_language, units, item_lines, line_items = _collect_line_items(raw)
+		if not line_items:
+			_copy_unenriched(path, run_dir)
+			continue
+		# invoices whose single prompt was answered before need no LLM call at all
+		prompt_bytes = _single_prompt(invoice_language, units, item_lines)
+		prompt_hash = _prompt_key(prompt_bytes)
+		cached = _cache_get(prompt_hash)
+		if cached is not None:
+			_apply_predictions(raw, line_items, cached, run_dir)
+			continue
+		groups.setdefault((invoice_language, frozenset(units)), []).append(
+			(path, run_dir, raw, line_items, item_lines, prompt_bytes)
+		)
+
+	for (invoice_language, units_key), members in groups.items():
+		if len(members) == 1:
+			_, run_dir, raw, line_items, _, prompt_bytes = members[0]
+			predictions = _classify(prompt_bytes, run_dir)
+			if predictions is None:
+				_mark_failed(raw, line_items, run_dir)
+			else:
+				_apply_predictions(raw, line_items, predictions, run_dir)
+			continue
+
+		buf = io.StringIO()
+		buf.write(_build_bz_reference(invoice_language, units_key))
+		buf.write(_BATCH_INSTRUCTIONS)
+		for k, member in enumerate(members, 1):
+			buf.write(f"\n# Invoice {k}:\n# Line item details:")
+			buf.write("".join(member[4]))
+		batch_run_dir = members[0][1]
+		batch_prompt_md = batch_run_dir / "bz_prompt_batch.md"
+		batch_bytes = buf.getvalue().encode("utf-8")
+		batch_prompt_md.write_bytes(batch_bytes)
+
+		# batch answers are cached under the batch prompt only: an invoice classified next to
+		# others is not necessarily classified the same way on its own
+		batch_hash = _prompt_key(batch_bytes)
+		batch_predictions = _cache_get(batch_hash)
+		if not isinstance(batch_predictions, list) or len(batch_predictions) != len(members):
+			try:
+				llm_result = run_structured_output_modern(batch_prompt_md, None, batch_run_dir)
+			except Exception:
+				for _, run_dir, raw, line_items, *_ in members:
+					_mark_failed(raw, line_items, run_dir)
+				continue
+			batch_predictions = _extract_batch_predictions(llm_result, len(members))
+			if all(batch_predictions):
+				_cache_put(batch_hash, batch_predictions)
+
+		for (_, run_dir, raw, line_items, *_), predictions in zip(members, batch_predictions):
+			_apply_predictions(raw, line_items, predictions, run_dir)
+
+	return results
+
+@traceable(name="BZArt Enrichment (async)")
+async def enrich_bz_art_async(raw_structured_path: Path, run_dir: Path, llm: Any = None) -> Dict[str, Any]:
+	"""Async variant of enrich_bz_art. Pass `llm` (see create_chat_model) to share one client."""
+	raw = _load_raw(raw_structured_path)
+	invoice_language, units, item_lines, line_items = _collect_line_items(raw)
+	if not line_items:
+		_copy_unenriched(raw_structured_path, run_dir)
+		return raw
+
+	predictions = await _classify_async(_single_prompt(invoice_language, units, item_lines), run_dir, llm)
+	if predictions is None:
+		_mark_failed(raw, line_items, run_dir)
+		return raw
+
+	_apply_predictions(raw, line_items, predictions, run_dir)
+	return raw
+
+
+async def enrich_bz_art_gather(
+	raw_structured_paths: List[Path], run_dirs: List[Path], concurrency: int = 8
+) -> List[Dict[str, Any]]:
+	"""
+	Enrich several invoices concurrently, at most `concurrency` LLM calls in flight. All calls
+	share one ChatOpenAI backed by a single httpx.AsyncClient, so connections are kept alive.
+	"""
+	import httpx
+
+	if len(raw_structured_paths) != len(run_dirs):
+		raise ValueError("raw_structured_paths and run_dirs must have the same length")
+	sem = asyncio.Semaphore(concurrency)
+	limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+	async with httpx.AsyncClient(limits=limits) as client:
+		llm = create_chat_model(http_async_client=client)
+
+		async def one(path: Path, run_dir: Path) -> Dict[str, Any]:
+			async with sem:
+				return await enrich_bz_art_async(path, run_dir, llm=llm)
 
-	return raw
\ No newline at end of file
+		return list(await asyncio.gather(*(one(p, d) for p, d in zip(raw_structured_paths, run_dirs))))
@@ -1,16 +1,19 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Optional, List, Tuple, Dict, Any
-import io
-import json
+import functools
 import os
-from dataclasses import dataclass, asdict
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from decimal import Decimal
 
 import fitz  # PyMuPDF
-from PIL import Image, ImageEnhance, ImageOps
 from langsmith import traceable
 
+from .io_utils import _dumps
+
 try:
     import numpy as np
 except Exception:
@@ -32,13 +35,25 @@ except Exception:
     WECHAT_AVAILABLE = False
 
 
+# Render zooms tried per page, cheapest first. Rendered pages are not upscaled afterwards, so
+# these are the final resolutions. Capped at 8x: a 12x A4 page would be ~72 MB of gray pixels.
+# The matrices are built once here instead of per page.
+_ZOOMS = (4.0, 6.0, 8.0)
+_ZOOM_MATRICES = tuple(fitz.Matrix(z, z) for z in _ZOOMS)
+
+# Swiss QR payloads start with this QR type
+_SPC = "SPC"
+# Header (QR type, version, coding) and a well-formed 21-char CH/LI IBAN in field 3, checked
+# on detector output so corrupted payloads with an intact header are dropped before parsing
+_QR_HEADER_IBAN_RE = re.compile(r"SPC\r?\n[^\n]*\n[^\n]*\n[ \t]*(?:CH|LI)\d{2}[A-Z0-9]{17}[ \t\r]*(?:\n|$)")
+
 WECHAT_DETECTOR_PATH = str(Path(__file__).parent / "WeChatQR" / "detect.prototxt")
 WECHAT_DETECTOR_MODEL = str(Path(__file__).parent / "WeChatQR" / "detect.caffemodel")
 WECHAT_SR_PATH = str(Path(__file__).parent / "WeChatQR" / "sr.prototxt")
 WECHAT_SR_MODEL = str(Path(__file__).parent / "WeChatQR" / "sr.caffemodel")
 
 
-@dataclass
+@dataclass(slots=True)
 class SwissQRAddress:
     """Swiss QR Code Address structure"""
 
@@ -51,10 +66,18 @@ class SwissQRAddress:
     country: str = ""
 
     def as_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-
-
-@dataclass
+        return {
+            "address_type": self.address_type,
+            "name": self.name,
+            "address_line_1": self.address_line_1,
+            "address_line_2": self.address_line_2,
+            "postal_code": self.postal_code,
+            "city": self.city,
+            "country": self.country,
+        }
+
+
+@dataclass(slots=True)
 class SwissQRInvoice:
     """Swiss QR Invoice data structure according to Swiss Payment Standards"""
 
@@ -92,15 +115,25 @@ class SwissQRInvoice:
     alternative_scheme_2: str = ""
 
     def as_dict(self) -> Dict[str, Any]:
-        result = asdict(self)
-        # Convert nested dataclasses
-        if self.creditor:
-            result["creditor"] = self.creditor.as_dict()
-        if self.ultimate_creditor:
-            result["ultimate_creditor"] = self.ultimate_creditor.as_dict()
-        if self.ultimate_debtor:
-            result["ultimate_debtor"] = self.ultimate_debtor.as_dict()
-        return result
+        # Built in one pass; dataclasses.asdict would deep-copy the addresses only to have
+        # them replaced by their own as_dict()
+        return {
+            "qr_type": self.qr_type,
+            "version": self.version,
+            "coding_type": self.coding_type,
+            "iban": self.iban,
+            "creditor": self.creditor.as_dict() if self.creditor else None,
+            "ultimate_creditor": self.ultimate_creditor.as_dict() if self.ultimate_creditor else None,
+            "amount": self.amount,
+            "currency": self.currency,
+            "ultimate_debtor": self.ultimate_debtor.as_dict() if self.ultimate_debtor else None,
+            "reference_type": self.reference_type,
+            "reference": self.reference,
+            "unstructured_message": self.unstructured_message,
+            "trailer": self.trailer,
+            "alternative_scheme_1": self.alternative_scheme_1,
+            "alternative_scheme_2": self.alternative_scheme_2,
+        }
 
 
 @traceable(name="Parse Swiss QR Address")
@@ -111,20 +144,13 @@ def parse_address(
     if start_idx >= len(fields):
         return None, start_idx
 
-    address_type = fields[start_idx] if start_idx < len(fields) else ""
-
-    if not address_type:
-        return None, start_idx + 7  # Skip 7 empty fields
-
-    name = fields[start_idx + 1] if start_idx + 1 < len(fields) else ""
+    chunk = fields[start_idx:start_idx + 7]
+    if len(chunk) < 7:
+        # parse_swiss_qr always pads to 35 fields; only direct callers can end up here
+        chunk += [""] * (7 - len(chunk))
+    address_type, name, address_line_1, address_line_2, postal_code, city, country = chunk
 
     if address_type == "S":  # Structured address
-        address_line_1 = fields[start_idx + 2] if start_idx + 2 < len(fields) else ""
-        address_line_2 = fields[start_idx + 3] if start_idx + 3 < len(fields) else ""
-        postal_code = fields[start_idx + 4] if start_idx + 4 < len(fields) else ""
-        city = fields[start_idx + 5] if start_idx + 5 < len(fields) else ""
-        country = fields[start_idx + 6] if start_idx + 6 < len(fields) else ""
-
         return (
             SwissQRAddress(
                 address_type=address_type,
@@ -138,12 +164,8 @@ def parse_address(
             start_idx + 7,
         )
 
-    elif address_type == "K":  # Combined address
-        address_line_1 = fields[start_idx + 2] if start_idx + 2 < len(fields) else ""
-        address_line_2 = fields[start_idx + 3] if start_idx + 3 < len(fields) else ""
+    if address_type == "K":  # Combined address
         # For combined addresses, fields 4-6 are empty
-        country = fields[start_idx + 6] if start_idx + 6 < len(fields) else ""
-
         return (
             SwissQRAddress(
                 address_type=address_type,
@@ -162,16 +184,12 @@ def parse_address(
 @traceable(name="Parse Swiss QR Invoice")
 def parse_swiss_qr(qr_text: str) -> SwissQRInvoice:
     """Parse Swiss QR Code text into structured SwissQRInvoice object"""
-    if not qr_text or not qr_text.startswith("SPC"):
+    if not qr_text or not qr_text.startswith(_SPC):
         raise ValueError("Invalid Swiss QR Code format")
 
-    # Split by line breaks and filter out empty lines at the end
-    lines = qr_text.strip().split("\n")
-    fields = [line.strip() for line in lines]
-
-    # Ensure we have minimum required fields (at least 31 fields for basic structure)
-    while len(fields) < 35:  # Pad with empty strings if needed
-        fields.append("")
+    # Split by line breaks; only the first 35 fields are defined, pad to exactly 35 in one step
+    fields = [line.strip() for line in qr_text.strip().split("\n")[:35]]
+    fields += [""] * (35 - len(fields))
 
     try:
         # Parse header (fields 0-2)
@@ -230,73 +248,115 @@ def parse_swiss_qr(qr_text: str) -> SwissQRInvoice:
     except (IndexError, ValueError) as e:
         raise ValueError(f"Failed to parse Swiss QR Code: {e}")
 
-def preprocess_image(image: Image.Image) -> Image.Image:
-    image = ImageOps.grayscale(image)
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(2)
-    image = image.resize((image.width * 2, image.height * 2), Image.LANCZOS)
-    return image
-
-
-def _pil_from_pixmap(pix):
-    """Convert PyMuPDF Pixmap to PIL Image"""
-    if pix.n - pix.alpha < 4:  # GRAY or RGB
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    else:  # CMYK
-        img = Image.frombytes("CMYK", [pix.width, pix.height], pix.samples)
-    return img
-
-def _wechat_decode(img: Image.Image) -> Optional[str]:
-    if not WECHAT_AVAILABLE or cv2 is None or wechat_qrcode is None:
-        return None
-    import os
-
-    if not (
+# Detectors (and CLAHE, which keeps scratch buffers) are not thread-safe, so each decode
+# thread keeps its own, created once per thread.
+_detectors = threading.local()
+
+def _get_clahe():
+    clahe = getattr(_detectors, "clahe", None)
+    if clahe is None:
+        clahe = _detectors.clahe = cv2.createCLAHE(clipLimit=20, tileGridSize=(8, 8))
+    return clahe
+
+
+def preprocess_array(arr: "np.ndarray", upscale: bool = False) -> "np.ndarray":
+    """
+    Binarize an RGB or gray uint8 array for the QR detectors: gray -> CLAHE -> 3x3 Gaussian
+    blur -> adaptive Gaussian threshold; returns a 0/255 array. Page renders get their
+    resolution from the MuPDF zoom, so only embedded images (fixed native size) ask for the
+    2x upscale, which is done on the gray image before thresholding.
+    """
+    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY) if arr.ndim == 3 else arr
+    if upscale:
+        gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
+    # apply() returns a new array, so the caller's buffer (pixmap view, read-only) is never written
+    gray = _get_clahe().apply(gray)
+    cv2.GaussianBlur(gray, (3, 3), 0, dst=gray)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 4)
+
+
+def preprocess_image(image, upscale: bool = False) -> "np.ndarray":
+    """preprocess_array for a PIL image (kept for callers of the old PIL-based API) or array."""
+    if not isinstance(image, np.ndarray):
+        image = np.asarray(image if image.mode in ("L", "RGB") else image.convert("RGB"))
+    return preprocess_array(image, upscale)
+
+
+def _pixmap_array(pix) -> "np.ndarray":
+    """
+    Zero-copy uint8 view (H x W for gray, as the page renders are, or H x W x n) onto a
+    GRAY/RGB Pixmap's samples.
+    The caller must keep `pix` alive while the view is in use.
+    """
+    if pix.n == 1:
+        return np.ndarray((pix.height, pix.width), dtype=np.uint8, buffer=pix.samples_mv)
+    return np.ndarray((pix.height, pix.width, pix.n), dtype=np.uint8, buffer=pix.samples_mv)
+
+@functools.lru_cache(maxsize=1)
+def _wechat_models_present() -> bool:
+    return (
         os.path.exists(WECHAT_DETECTOR_PATH)
         and os.path.exists(WECHAT_DETECTOR_MODEL)
         and os.path.exists(WECHAT_SR_PATH)
         and os.path.exists(WECHAT_SR_MODEL)
-    ):
+    )
+
+def _get_wechat_detector():
+    """WeChat detector of the calling thread; None if the model files are missing."""
+    if not _wechat_models_present():
         return None
-    try:
-        arr = np.array(img.convert("RGB")) if np is not None else None
-        if arr is None:
-            return None
-        detector = wechat_qrcode.WeChatQRCode(
+    detector = getattr(_detectors, "wechat", None)
+    if detector is None:
+        detector = _detectors.wechat = wechat_qrcode.WeChatQRCode(
             WECHAT_DETECTOR_PATH,
             WECHAT_DETECTOR_MODEL,
             WECHAT_SR_PATH,
             WECHAT_SR_MODEL,
         )
-        res, _ = detector.detectAndDecode(arr)
+    return detector
+
+def _get_cv_qr_detector():
+    detector = getattr(_detectors, "opencv", None)
+    if detector is None:
+        detector = _detectors.opencv = cv2.QRCodeDetector()
+    return detector
+
+def _wechat_decode(img: "np.ndarray") -> Optional[str]:
+    if not WECHAT_AVAILABLE or cv2 is None or wechat_qrcode is None:
+        return None
+    try:
+        detector = _get_wechat_detector()
+        if detector is None:
+            return None
+        # single-channel input is accepted as is; the detector works on gray internally
+        res, _ = detector.detectAndDecode(img)
         if res:
             # Only return the first valid QR and do not print here
             for txt in res:
-                if isinstance(txt, str) and txt.strip() and txt.startswith("SPC"):
+                if isinstance(txt, str) and _QR_HEADER_IBAN_RE.match(txt):
                     return txt
     except Exception:
         return None
     return None
 
-def _opencv_decode(img: Image.Image) -> Optional[str]:
+def _opencv_decode(img: "np.ndarray") -> Optional[str]:
     if cv2 is None:
         return None
     try:
-        arr = np.array(img.convert("RGB"))[:, :, ::-1] if np is not None else None
-        if arr is None:
-            return None
-        detector = cv2.QRCodeDetector()
+        # preprocess_array output is a single-channel binary, which QRCodeDetector takes directly
+        arr = img
+        detector = _get_cv_qr_detector()
         try:
             ok, texts, points, _ = detector.detectAndDecodeMulti(arr)
             if ok and texts is not None:
                 for t in texts:
-                    if isinstance(t, str) and t.strip() and t.startswith("SPC"):
+                    if isinstance(t, str) and _QR_HEADER_IBAN_RE.match(t):
                         return t
         except Exception:
             pass
         try:
             text, points, _ = detector.detectAndDecode(arr)
-            if text and text.strip() and text.startswith("SPC"):
+            if text and _QR_HEADER_IBAN_RE.match(text):
                 return text
         except Exception:
             pass
@@ -305,148 +365,253 @@ def _opencv_decode(img: Image.Image) -> Optional[str]:
     return None
 
 
+def _decode_qr(gray: "np.ndarray") -> Tuple[Optional[str], Optional[str]]:
+    """Run WeChat, then OpenCV, on the same binarized array; returns (text, method)."""
+    qr_text = _wechat_decode(gray)
+    if qr_text:
+        return qr_text, "WeChat"
+    qr_text = _opencv_decode(gray)
+    if qr_text:
+        return qr_text, "OpenCV"
+    return None, None
+
+
+def _preprocess_and_decode(arr: "np.ndarray", upscale: bool, _keepalive: Any = None) -> Tuple[Optional[str], Optional[str]]:
+    # _keepalive holds the Pixmap that `arr` is a view of until this job is done
+    try:
+        return _decode_qr(preprocess_array(arr, upscale))
+    except Exception:
+        return None, None
+
+
+_DECODE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+@functools.lru_cache(maxsize=1)
+def _decode_pool() -> ThreadPoolExecutor:
+    """Long-lived decode threads, so their per-thread detectors survive across scans."""
+    return ThreadPoolExecutor(max_workers=_DECODE_WORKERS, thread_name_prefix="qr-decode")
+
+
+def _race_decodes(jobs) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Preprocess + decode the (page_num, pixmap, array, upscale) items from `jobs` in the decode
+    pool and return the first (text, method) hit. `jobs` is advanced on the calling thread, which
+    keeps all MuPDF rendering there (PyMuPDF is not thread-safe); OpenCV releases the GIL, so
+    renders and decodes overlap. The race stays within one page: a page's decodes are all
+    collected before the next page's are queued, so pages keep their last -> first priority.
+    After a hit no further jobs are rendered and queued ones are cancelled.
+    """
+    pool = _decode_pool()
+    limit = 2 * _DECODE_WORKERS  # renders in flight; bounds pixmap memory
+    pending = set()
+
+    def collect(timeout):
+        nonlocal pending
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for fut in done:
+            qr_text, method = fut.result()
+            if qr_text:
+                return qr_text, method
+        return None
+
+    current_page = None
+    try:
+        for page_num, pix, arr, upscale in jobs:
+            if page_num != current_page:
+                # settle the previous page before this one can produce a hit
+                while pending:
+                    hit = collect(None)
+                    if hit:
+                        return hit
+                current_page = page_num
+            pending.add(pool.submit(_preprocess_and_decode, arr, upscale, pix))
+            hit = collect(None if len(pending) >= limit else 0)
+            if hit:
+                return hit
+        while pending:
+            hit = collect(None)
+            if hit:
+                return hit
+        return None, None
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def _page_numbers(doc) -> range:
+    page_count = doc.page_count if hasattr(doc, "page_count") else len(doc)
+    # last -> first: the QR-bill is usually on the last page
+    return range(page_count - 1, -1, -1)
+
+
+def _shrink_store() -> None:
+    """Empty MuPDF's resource store once a page is done, so it does not grow across pages."""
+    try:
+        fitz.TOOLS.store_shrink(100)
+    except Exception:
+        pass
+
+
+def _text_payload(text: str) -> Optional[str]:
+    """
+    QR payload printed in one page's text. The candidate runs from "SPC" to the "EPD" trailer
+    line and must parse with a CH/LI IBAN before it is used, so surrounding page text is never
+    taken for it.
+    """
+    idx = text.find(_SPC + "\n")
+    while idx != -1:
+        if idx == 0 or text[idx - 1] == "\n":
+            lines = text[idx:idx + 1200].split("\n")
+            end = next((i for i, line in enumerate(lines) if line.strip() == "EPD"), None)
+            if end is not None:
+                candidate = "\n".join(lines[:end + 1])
+                try:
+                    if parse_swiss_qr(candidate).iban[:2] in ("CH", "LI"):
+                        return candidate
+                except Exception:
+                    pass
+        idx = text.find(_SPC + "\n", idx + 1)
+    return None
+
+
+def _text_layer_qr(doc) -> Optional[str]:
+    """
+    QR payload printed in the text layer (e-banking generated bills often carry it). Pages are
+    extracted one at a time from the last page backwards, stopping at the first payload.
+    """
+    for page_num in _page_numbers(doc):
+        try:
+            text = doc.load_page(page_num).get_text("text")
+        except Exception:
+            continue
+        payload = _text_payload(text)
+        if payload:
+            return payload
+    return None
+
+
+def _embedded_image_jobs(doc):
+    """Phase 1: embedded images of every page at native resolution (no rasterization)."""
+    for page_num in _page_numbers(doc):
+        try:
+            images = doc.load_page(page_num).get_images(full=True)
+        except Exception:
+            continue
+        for info in images:
+            xref = info[0]
+            try:
+                base_image = doc.extract_image(xref)
+                img_bytes = base_image.get("image")
+                if not img_bytes:
+                    continue
+                pix = None
+                # decode the stored image straight to gray; formats OpenCV cannot read go via MuPDF
+                img_arr = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+                if img_arr is None:
+                    pix = fitz.Pixmap(doc, xref)
+                    if pix.alpha or pix.n - pix.alpha >= 4:
+                        # CMYK and/or alpha: convert to plain RGB first
+                        pix = fitz.Pixmap(fitz.csRGB, pix, 0)
+                    img_arr = _pixmap_array(pix)
+            except Exception:
+                continue
+            yield page_num, pix, img_arr, True
+        pix = img_arr = None
+        _shrink_store()
+
+
+def _slip_render_jobs(doc):
+    """Phase 2: the payment-slip area of every page at each zoom."""
+    for page_num in _page_numbers(doc):
+        try:
+            page = doc.load_page(page_num)
+            clip = _payment_slip_clip(page.rect)
+        except Exception:
+            continue
+        for matrix in _ZOOM_MATRICES:
+            try:
+                # MuPDF rasterizes only the clip rectangle, straight to 1-byte gray
+                pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+            except Exception:
+                continue
+            yield page_num, pix, _pixmap_array(pix), False
+        pix = page = None
+        _shrink_store()
+
+
+def _full_render_jobs(doc):
+    """Phase 3: full-page renders of every page at each zoom."""
+    for page_num in _page_numbers(doc):
+        try:
+            page = doc.load_page(page_num)
+        except Exception:
+            continue
+        for matrix in _ZOOM_MATRICES:
+            try:
+                pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+            except Exception:
+                continue
+            yield page_num, pix, _pixmap_array(pix), False
+        pix = page = None
+        _shrink_store()
+
+
+def _payment_slip_clip(rect):
+    """
+    Lower half, left ~60% of the page: the Swiss QR-bill puts the 46 x 46 mm code in the
+    payment part at the bottom, ending about 118 mm (quiet zone included) from the left edge.
+    """
+    return fitz.Rect(rect.x0, rect.y0 + rect.height / 2, rect.x0 + rect.width * 0.6, rect.y1)
+
+
+def _emit_result(qr_text: str, found_method: Optional[str], pdf_path: Path, output_dir: Path) -> dict:
+    """Parse a decoded QR text, write <stem>_qr.json and build the scan_qr_code result."""
+    if found_method:
+        print(f"Extracted with: {found_method}")
+    out_path = Path(output_dir) / (pdf_path.stem + "_qr.json")
+    json_data = {"raw_qr_text": qr_text}
+    invoice = None
+    try:
+        invoice = parse_swiss_qr(qr_text)
+        json_data["parsed_invoice"] = invoice.as_dict()
+    except Exception as e:
+        print("Failed to parse Swiss QR invoice:", e)
+    with open(out_path, "wb") as f:
+        f.write(_dumps(json_data))
+        print("Amount to pay:", invoice.amount if invoice is not None else None)
+    return {
+        "qr_text": qr_text,
+        "method": found_method,
+        "invoice": json_data.get("parsed_invoice"),
+        "output_file": str(out_path),
+    }
+
+
 @traceable(name="Scan QR Code from PDF")
 def scan_qr_code(pdf_path: Path, output_dir: Path, use_heuristic: bool = False) -> dict:
 	doc = None
 	found_method = None
+	os.makedirs(output_dir, exist_ok=True)
 	try:
 		doc = fitz.open(pdf_path)
-		page_count = doc.page_count if hasattr(doc, "page_count") else len(doc)
-
-		# Phase 1: scan the lower half of every page (last -> first)
-		for page_num in range(page_count - 1, -1, -1):
-			page = doc.load_page(page_num)
-			for zoom in (4.0, 6.0, 8.0):
-				try:
-					pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
-					page_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-					# Crop to lower half
-					w, h = page_img.size
-					lower_half = page_img.crop((0, h // 2, w, h))
-					pre_img = preprocess_image(lower_half)
-					qr_text = _wechat_decode(pre_img)
-					if qr_text:
-						found_method = "WeChat"
-					else:
-						qr_text = _opencv_decode(pre_img)
-						if qr_text:
-							found_method = "OpenCV"
-					if qr_text and qr_text.startswith("SPC"):
-						if found_method:
-							print(f"Extracted with: {found_method}")
-						os.makedirs(output_dir, exist_ok=True)
-						out_path = Path(output_dir) / (pdf_path.stem + "_qr.json")
-						json_data = {"raw_qr_text": qr_text}
-						try:
-							invoice = parse_swiss_qr(qr_text)
-							json_data["parsed_invoice"] = invoice.as_dict()
-						except Exception as e:
-							print("Failed to parse Swiss QR invoice:", e)
-						with open(out_path, "w", encoding="utf-8") as f:
-							json.dump(json_data, f, ensure_ascii=False, indent=2)
-							print("Amount to pay:", invoice.amount if 'invoice' in locals() else None)
-						return {
-							"qr_text": qr_text,
-							"method": found_method,
-							"invoice": json_data.get("parsed_invoice"),
-							"output_file": str(out_path),
-						}
-				except Exception:
-					continue
-
-		# Phase 2: fallback to original behavior (embedded images first, then full-page renders)
-		for page_num in range(page_count - 1, -1, -1):
-			page = doc.load_page(page_num)
-			for info in page.get_images(full=True):
-				xref = info[0]
-				try:
-					base_image = doc.extract_image(xref)
-					img_bytes = base_image.get("image")
-					if not img_bytes:
-						continue
-					try:
-						pil_img = Image.open(io.BytesIO(img_bytes))
-					except Exception:
-						pix = fitz.Pixmap(doc, xref)
-						pil_img = _pil_from_pixmap(pix)
-					pre_img = preprocess_image(pil_img)
-					qr_text = _wechat_decode(pre_img)
-					if qr_text:
-						found_method = "WeChat"
-					else:
-						qr_text = _opencv_decode(pre_img)
-						if qr_text:
-							found_method = "OpenCV"
-					if qr_text and qr_text.startswith("SPC"):
-						if found_method:
-							print(f"Extracted with: {found_method}")
-						os.makedirs(output_dir, exist_ok=True)
-						out_path = Path(output_dir) / (pdf_path.stem + "_qr.json")
-						json_data = {"raw_qr_text": qr_text}
-						try:
-							invoice = parse_swiss_qr(qr_text)
-							json_data["parsed_invoice"] = invoice.as_dict()
-						except Exception as e:
-							print("Failed to parse Swiss QR invoice:", e)
-						with open(out_path, "w", encoding="utf-8") as f:
-							json.dump(json_data, f, ensure_ascii=False, indent=2)
-							print("Amount to pay:", invoice.amount if 'invoice' in locals() else None)
-						return {
-							"qr_text": qr_text,
-							"method": found_method,
-							"invoice": json_data.get("parsed_invoice"),
-							"output_file": str(out_path),
-						}
-				except Exception:
-					continue
-			for zoom in (4.0, 6.0, 8.0):
-				try:
-					pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
-					page_img = Image.frombytes(
-						"RGB", [pix.width, pix.height], pix.samples
-					)
-					pre_img = preprocess_image(page_img)
-					qr_text = _wechat_decode(pre_img)
-					if qr_text:
-						found_method = "WeChat"
-					else:
-						qr_text = _opencv_decode(pre_img)
-						if qr_text:
-							found_method = "OpenCV"
-					if qr_text and qr_text.startswith("SPC"):
-						if found_method:
-							print(f"Extracted with: {found_method}")
-						os.makedirs(output_dir, exist_ok=True)
-						out_path = Path(output_dir) / (pdf_path.stem + "_qr.json")
-						json_data = {"raw_qr_text": qr_text}
-						try:
-							invoice = parse_swiss_qr(qr_text)
-							json_data["parsed_invoice"] = invoice.as_dict()
-						except Exception as e:
-							print("Failed to parse Swiss QR invoice:", e)
-						with open(out_path, "w", encoding="utf-8") as f:
-							json.dump(json_data, f, ensure_ascii=False, indent=2)
-							print("Amount to pay:", invoice.amount if 'invoice' in locals() else None)
-						return {
-							"qr_text": qr_text,
-							"method": found_method,
-							"invoice": json_data.get("parsed_invoice"),
-							"output_file": str(out_path),
-						}
-				except Exception:
-					continue
-
-		# If no QR code found, save error JSON
-		os.makedirs(output_dir, exist_ok=True)
-		out_path = Path(output_dir) / (pdf_path.stem + "_qr_error.json")
-		with open(out_path, "w", encoding="utf-8") as f:
-			json.dump({"error": "No QR code found"}, f, ensure_ascii=False, indent=2)
+
+		# Phase 0: payload already in the text layer, nothing to rasterize or decode
+		qr_text = _text_layer_qr(doc)
+		if qr_text:
+			return _emit_result(qr_text, "text layer", pdf_path, output_dir)
+
+		# Every phase walks the pages last -> first. Phase 1: embedded images (no render cost);
+		# Phase 2: payment-slip area renders; Phase 3: full-page renders
+		for jobs in (_embedded_image_jobs(doc), _slip_render_jobs(doc), _full_render_jobs(doc)):
+			qr_text, found_method = _race_decodes(jobs)
+			if qr_text:  # decoders only return texts with an SPC header and a valid IBAN
+				return _emit_result(qr_text, found_method, pdf_path, output_dir)
 
 		# Heuristic fallback: only if explicitly allowed
 		if use_heuristic:
 			try:
 				from .io_utils import find_iban_in_markdown  # lazy import to avoid circular issues
-				iban = find_iban_in_markdown(output_dir)
+				iban = find_iban_in_markdown(Path(output_dir))
 			except Exception:
 				iban = None
 
@@ -466,8 +631,8 @@ def scan_qr_code(pdf_path: Path, output_dir: Path, use_heuristic: bool = False)
 					},
 				}
 				fallback_path = Path(output_dir) / (pdf_path.stem + "_qr_fallback.json")
-				with open(fallback_path, "w", encoding="utf-8") as f:
-					json.dump(fallback, f, ensure_ascii=False, indent=2)
+				with open(fallback_path, "wb") as f:
+					f.write(_dumps(fallback))
 				# Return a consistent structure similar to successful detections:
 				# include qr_text (None here), method, invoice (parsed structure), and output_file.
 				return {
@@ -477,6 +642,11 @@ def scan_qr_code(pdf_path: Path, output_dir: Path, use_heuristic: bool = False)
 					"output_file": str(fallback_path),
 				}
 
+		# No QR code (and no heuristic IBAN) found: save error JSON
+		out_path = Path(output_dir) / (pdf_path.stem + "_qr_error.json")
+		with open(out_path, "wb") as f:
+			f.write(_dumps({"error": "No QR code found"}))
+
 		return {"error": "No QR code found", "output_file": str(out_path)}
 	finally:
 		if doc is not None:
@@ -1,23 +1,66 @@
 from __future__ import annotations
-import json
+import asyncio
+import functools
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
-from langchain_core.runnables import RunnableLambda
-from langchain_core.tracers import ConsoleCallbackHandler
 from langsmith import traceable
 
 from .parsers import convert_pdf_to_markdown
 from .qr import scan_qr_code
-from .db.db_client import get_customer_by_iban, choose_prompt
-from .io_utils import write_markdown
-from .structured_output import run_structured_output_modern
-
-handler = ConsoleCallbackHandler()
+from .db.db_client import _normalize_iban, get_customer_by_iban, choose_prompt
+from .io_utils import (
+    TOKEN_IBAN,
+    TOKEN_IBAN_NUMBER,
+    TOKEN_SPC,
+    _dumps,
+    _loads,
+    atomic_write,
+    scan_markdown_tokens,
+    write_markdown,
+)
+from .structured_output import (
+    create_chat_model,
+    dump_structured_output,
+    run_structured_output_modern,
+    run_structured_output_modern_batch,
+)
+
+def _atomic_write_json(path: Path, obj) -> None:
+    atomic_write(path, _dumps(obj))
 
 # add import for postprocess logic
-from .postprocess_bz import enrich_bz_art
+from .postprocess_bz import enrich_bz_art, enrich_bz_art_gather
+
+# Docling and Marker models conflict when run side by side, so in 'all' mode only their
+# conversions are serialized; QR scanning and markdown writing overlap with them.
+_PARSER_MODEL_LOCK = threading.Lock()
+
+def _convert_locked(pdf_path: Path, engine: str, use_llm: bool, output_dir: Path):
+    with _PARSER_MODEL_LOCK:
+        return convert_pdf_trace(pdf_path, engine, use_llm, output_dir)
+
+# A Swiss QR payload starts with "SPC" and the heuristic looks for a (possibly spaced) CH IBAN
+# in the markdown; when the markdown has neither nor an "IBAN" label, the second QR pass is skipped.
+_QR_FINGERPRINT_TOKENS = frozenset((TOKEN_SPC, TOKEN_IBAN_NUMBER, TOKEN_IBAN))
+
+def _has_qr_fingerprint(*texts: str) -> bool:
+    return any(
+        scan_markdown_tokens(text, _QR_FINGERPRINT_TOKENS) & _QR_FINGERPRINT_TOKENS for text in texts
+    )
+
+def _should_retry_qr_heuristic(*markdowns: str) -> bool:
+    """
+    Whether the heuristic QR pass can find anything: always when no markdown was produced
+    (parser failed or empty output, nothing to check), else when the markdown has a QR header
+    or IBAN-like token. Only the in-memory markdown is checked; the PDF is not reopened.
+    """
+    present = [md for md in markdowns if md and md.strip()]
+    return not present or _has_qr_fingerprint(*present)
 
 @traceable(name="Scan QR Code")
 def scan_qr_trace(pdf_path: Path, run_dir: Path, use_heuristic: bool = False):
@@ -52,14 +95,182 @@ def _normalize_invoice_field(inv) -> str:
             combined = " ".join([p for p in [name, city] if p])
             if combined:
                 return combined
-        # fallback to JSON string
-        try:
-            return json.dumps(inv, ensure_ascii=False)
-        except Exception:
-            return str(inv)
+        # nothing usable for a lookup: an empty key makes the lookup report "customer not found"
+        # (a serialized dict can never match an IBAN)
+        return ""
     # other types
     return str(inv)
 
+# Swiss IBANs: "CH" + 19 alphanumerics (check digits, clearing number, account)
+_IBAN_BODY_LEN = 19
+
+def _looks_like_iban(compact: str) -> bool:
+    """compact: an _normalize_iban() result (no whitespace of any kind, upper case)."""
+    return len(compact) == _IBAN_BODY_LEN + 2 and compact[:2] == "CH" and compact.isascii() and compact.isalnum()
+
+def _iban_to_int(compact: str) -> int:
+    """Compact cache key: the part after "CH" of a _looks_like_iban() value read as a base-36 number."""
+    return int(compact[2:], 36)
+
+# found customers only: a miss may be a customer that is added later or a transient DB error
+_CUSTOMER_CACHE: dict[int | str, dict] = {}
+_CUSTOMER_CACHE_MAX = 256
+_CUSTOMER_CACHE_LOCK = threading.Lock()
+
+def _cached_customer(key: int | str, search_val: str):
+    """Customer for search_val, cached under key."""
+    with _CUSTOMER_CACHE_LOCK:
+        cust = _CUSTOMER_CACHE.get(key)
+    if cust is not None:
+        return cust
+    cust = get_customer_by_iban(search_val)
+    if cust is not None:
+        with _CUSTOMER_CACHE_LOCK:
+            if len(_CUSTOMER_CACHE) >= _CUSTOMER_CACHE_MAX:
+                # evict the oldest entry (dicts keep insertion order)
+                _CUSTOMER_CACHE.pop(next(iter(_CUSTOMER_CACHE)))
+            _CUSTOMER_CACHE[key] = cust
+    return cust
+
+def _lookup_customer(search_val: str):
+    """
+    get_customer_by_iban, memoized per process when INVOICE_CHAIN_CACHE_CUSTOMERS is set (batch
+    runs hitting the same customers); "not found" is never cached. IBANs are keyed by
+    _iban_to_int, so spellings that differ only in whitespace or case share an entry. Cached
+    results are shared: callers copy before modifying them.
+    """
+    if not os.environ.get("INVOICE_CHAIN_CACHE_CUSTOMERS"):
+        return get_customer_by_iban(search_val)
+    compact = _normalize_iban(search_val)
+    if _looks_like_iban(compact):
+        return _cached_customer(_iban_to_int(compact), compact)
+    return _cached_customer(search_val, search_val)
+
+@functools.lru_cache(maxsize=64)
+def _customer_prompt_from_file(path: str, mtime_ns: int, size: int) -> str:
+    # keyed on (path, mtime, size): a rewritten customer.json is read again, an unchanged one is not
+    with open(path, "rb") as f:
+        cust = _loads(f.read())
+    return choose_prompt(cust)  # choose_prompt returns prompt text (see db.py)
+
+def _load_customer_prompt(run_dir: Path) -> Optional[str]:
+    """Customer prompt for structured output from run_dir/customer.json (None if unavailable)."""
+    customer_json_path = run_dir / "customer.json"
+    # fetch customer prompt via db.choose_prompt if customer found; fallback to generic prompt
+    try:
+        st = customer_json_path.stat()
+    except FileNotFoundError:
+        print("No customer.json found; structured output will use default/empty customer prompt.")
+        return None
+    try:
+        return _customer_prompt_from_file(str(customer_json_path), st.st_mtime_ns, st.st_size)
+    except Exception as e:
+        print(f"Warning: could not read customer.json for structured output: {e}", file=sys.stderr)
+        return None
+
+async def run_structured_output_gather(markdown_paths: list[Path], run_dirs: list[Path], concurrency: int = 8) -> list[Optional[Path]]:
+    """
+    Structured output + BZArt enrichment for several converted invoices: one abatch() over a
+    shared httpx.AsyncClient with at most `concurrency` LLM calls in flight. Each run_dir gets
+    the same files as the single-PDF flow; returns the raw_structured_output.json paths (None
+    where it failed).
+    """
+    import httpx
+
+    if len(markdown_paths) != len(run_dirs):
+        raise ValueError("markdown_paths and run_dirs must have the same length")
+    customer_prompts = [_load_customer_prompt(d) for d in run_dirs]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        llm = create_chat_model(http_async_client=client)
+        results = await run_structured_output_modern_batch(
+            markdown_paths, customer_prompts, llm=llm, max_concurrency=concurrency, as_model=True, prune=True
+        )
+
+    so_paths: list[Optional[Path]] = []
+    for md_path, run_dir, structured_result in zip(markdown_paths, run_dirs, results):
+        try:
+            if isinstance(structured_result, Exception):
+                raise structured_result
+            so_out = run_dir / "raw_structured_output.json"
+            atomic_write(so_out, dump_structured_output(structured_result))
+            print(f"Wrote structured output: {so_out}")
+            so_paths.append(so_out)
+        except Exception as e:
+            print(f"❌ Structured output step failed for {md_path}: {e}", file=sys.stderr)
+            so_paths.append(None)
+
+    done = [(so, d) for so, d in zip(so_paths, run_dirs) if so is not None]
+    if done:
+        try:
+            await enrich_bz_art_gather([so for so, _ in done], [d for _, d in done], concurrency)
+        except Exception as e:
+            print(f"Warning: BZArt enrichment failed: {e}", file=sys.stderr)
+    return so_paths
+
+def run_structured_output_batch(markdown_paths: list[Path], run_dirs: list[Path], concurrency: int = 8) -> list[Optional[Path]]:
+    """Blocking wrapper around run_structured_output_gather for CLI-style callers."""
+    return asyncio.run(run_structured_output_gather(markdown_paths, run_dirs, concurrency))
+
+def _find_run_markdown(run_dir: Path, pdf_stem: Optional[str] = None) -> Optional[Path]:
+    """<pdf_stem>.docling.md, else <pdf_stem>.marker.md in run_dir (any stem when none is given)."""
+    for engine in ("docling", "marker"):
+        if pdf_stem:
+            candidate = run_dir / f"{pdf_stem}.{engine}.md"
+            if candidate.is_file():
+                return candidate
+        else:
+            # write_markdown's temporary files start with "." and end in ".tmp", so never match
+            found = sorted(run_dir.glob(f"*.{engine}.md"))
+            if found:
+                return found[0]
+    return None
+
+def run_structured_output_for_run_dirs(run_dirs: list[Path], pdf_stem: Optional[str] = None) -> int:
+    """
+    Structured-output-only mode: one batched structured-output pass (run_structured_output_batch)
+    over the markdown already in each run_dir. Returns 2 when no run_dir has markdown, 1 when
+    some run_dir has none or its structured output failed, else 0.
+    """
+    markdown_paths: list[Path] = []
+    found_dirs: list[Path] = []
+    for run_dir in run_dirs:
+        md_path = _find_run_markdown(run_dir, pdf_stem)
+        if md_path is None:
+            print(f"Error: no .docling.md or .marker.md markdown found in {run_dir}", file=sys.stderr)
+            continue
+        markdown_paths.append(md_path)
+        found_dirs.append(run_dir)
+    if not markdown_paths:
+        return 2
+    so_paths = run_structured_output_batch(markdown_paths, found_dirs)
+    if len(found_dirs) < len(run_dirs) or any(so is None for so in so_paths):
+        return 1
+    return 0
+
+def _maybe_run_structured_output(md_path: Path, customer_prompt: Optional[str], run_dir: Path) -> Optional[Path]:
+    """
+    Structured output for md_path into run_dir/raw_structured_output.json, then BZArt enrichment.
+    Failures are reported but never fail the run; returns the structured-output path or None.
+    """
+    try:
+        structured_result = run_structured_output_modern(md_path, customer_prompt, run_dir, as_model=True, prune=True)
+        so_out = run_dir / "raw_structured_output.json"
+        atomic_write(so_out, dump_structured_output(structured_result))
+        print(f"Wrote structured output: {so_out}")
+    except Exception as e:
+        print(f"❌ Structured output step failed: {e}", file=sys.stderr)
+        # don't fail the whole run for structured-output failure; continue
+        return None
+
+    # attempt BZArt enrichment after structured output
+    try:
+        enrich_bz_art(so_out, run_dir)
+        print(f"Wrote BZ-enriched structured output: {run_dir / 'enriched_structured_output.json'}")
+    except Exception as e:
+        print(f"Warning: BZArt enrichment failed: {e}", file=sys.stderr)
+    return so_out
+
 def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm: bool, qr_only: bool, run_dir: Path, structured_output_flag: bool = False) -> int:
     try:
         # Initialize QR state variables so they exist for all branches
@@ -68,8 +279,7 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
 
         # Structured-output-only mode (no parser requested)
         if structured_output_flag and parser_name is None:
-            # ...existing code...
-            return 0
+            return run_structured_output_for_run_dirs([run_dir], copied_pdf.stem if copied_pdf is not None else None)
 
         # From here, require a copied_pdf for the usual flows
         if copied_pdf is None:
@@ -79,14 +289,12 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
         # --- New: QR-only mode handling ---
         if qr_only:
             # run QR scanner (no heuristic first)
-            qr_runnable = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=False), name="QR Scanner")
-            qr_result = qr_runnable.invoke(None, config={"callbacks": [handler]})
+            qr_result = scan_qr_trace(copied_pdf, run_dir, use_heuristic=False)
 
             # If no QR found, retry with heuristic (uses written markdown if available)
             if qr_result.get("qr_result") is None:
                 print("No Swiss QR code found. Retrying with heuristic...")
-                qr_runnable_h = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=True), name="QR Scanner (heuristic)")
-                qr_result = qr_runnable_h.invoke(None, config={"callbacks": [handler]})
+                qr_result = scan_qr_trace(copied_pdf, run_dir, use_heuristic=True)
 
             if qr_result.get("qr_result") is None:
                 print("No Swiss QR code found.")
@@ -97,7 +305,7 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
                 parsed_invoice = qr_info["invoice"]
                 # normalize invoice payload (dict or str) and try IBAN lookup
                 search_val = _normalize_invoice_field(parsed_invoice)
-                cust = get_customer_by_iban(search_val)
+                cust = _lookup_customer(search_val)
                 if not cust:
                     print("Error: customer not found by IBAN. Aborting.", file=sys.stderr)
                     return 5
@@ -108,14 +316,13 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
                 # Ensure we write a dict so we can append the prompt consistently
                 cust_to_write = dict(cust) if isinstance(cust, dict) else {"customer": cust}
                 cust_to_write["customer_prompt"] = prompt_key
-                cust_out.write_text(json.dumps(cust_to_write, ensure_ascii=False, indent=4), encoding="utf-8")
+                _atomic_write_json(cust_out, cust_to_write)
                 return 0 if qr_result and qr_result.get("qr_result") is not None else 1
 
         # Single parser modes: run parser first, write markdown, then QR (with heuristic fallback)
         if parser_name in ["docling", "marker"]:
-            parser_runnable = RunnableLambda(lambda _: convert_pdf_trace(copied_pdf, parser_name, use_llm, run_dir), name=f"{parser_name.capitalize()} Parser")
             # run parser synchronously
-            parser_result = parser_runnable.invoke(None, config={"callbacks": [handler]})
+            parser_result = convert_pdf_trace(copied_pdf, parser_name, use_llm, run_dir)
 
             # Write markdown output (required for heuristic fallback)
             try:
@@ -128,16 +335,15 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
                 return 4
 
             # Now run QR scan (no heuristic first)
-            qr_runnable = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=False), name="QR Scanner")
-            qr_result = qr_runnable.invoke(None, config={"callbacks": [handler]})
+            qr_result = scan_qr_trace(copied_pdf, run_dir, use_heuristic=False)
 
-            # If no QR found, retry with heuristic (uses written markdown)
-            if qr_result.get("qr_result") is None:
+            # If no QR found, retry with heuristic (uses written markdown) unless nothing has a QR/IBAN token
+            if qr_result.get("qr_result") is None and _should_retry_qr_heuristic(markdown):
                 print("No Swiss QR code found. Retrying with heuristic from markdown...")
-                qr_runnable_h = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=True), name="QR Scanner (heuristic)")
-                qr_result = qr_runnable_h.invoke(None, config={"callbacks": [handler]})
+                qr_result = scan_qr_trace(copied_pdf, run_dir, use_heuristic=True)
 
             # Handle QR result
+            prompt_key = None
             if qr_result.get("qr_result") is None:
                 print("No Swiss QR code found.")
             else:
@@ -147,114 +353,80 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
                     parsed_invoice = qr_info["invoice"]
                     # Normalize invoice payload and try IBAN lookup
                     search_val = _normalize_invoice_field(parsed_invoice)
-                    cust = get_customer_by_iban(search_val)
+                    cust = _lookup_customer(search_val)
                     if not cust:
                         print("Error: customer not found by IBAN. Aborting.", file=sys.stderr)
                         return 5
                     cust_out = run_dir / "customer.json"
-                    cust_out.write_text(json.dumps(cust, ensure_ascii=False, indent=4), encoding="utf-8")
+                    _atomic_write_json(cust_out, cust)
                     prompt_key = choose_prompt(cust)
 
             # At this point QR may have been extracted and customer.json may exist
             # If user requested structured output, run LLM-based structured extraction using customer prompt + markdown
             if structured_output_flag:
-                customer_json_path = run_dir / "customer.json"
-                # fetch customer prompt via db.choose_prompt if customer found; fallback to generic prompt
-                customer_prompt = None
-                if customer_json_path.exists():
-                    try:
-                        cust = json.loads(customer_json_path.read_text(encoding="utf-8"))
-                        customer_prompt = choose_prompt(cust)  # choose_prompt returns prompt text (see db.py)
-                    except Exception as e:
-                        print(f"Warning: could not read customer.json for structured output: {e}", file=sys.stderr)
-                else:
-                    print("No customer.json found; structured output will use default/empty customer prompt.")
-
-                # run structured output: use the markdown file we wrote as context
-                try:
-                    # written is the path returned from write_markdown (string or Path)
-                    md_path = Path(written)
-                    structured_result = run_structured_output_modern(md_path, customer_prompt, run_dir)
-                    so_out = run_dir / "raw_structured_output.json"
-                    so_out.write_text(json.dumps(structured_result, ensure_ascii=False, indent=4), encoding="utf-8")
-                    print(f"Wrote structured output: {so_out}")
-                except Exception as e:
-                    print(f"❌ Structured output step failed: {e}", file=sys.stderr)
-                    # don't fail the whole run for structured-output failure; continue
-
-                # NEW: attempt BZArt enrichment after structured output
-                try:
-                    enriched = enrich_bz_art(so_out, run_dir)
-                    print(f"Wrote BZ-enriched structured output: {run_dir / 'enriched_structured_output.json'}")
-                except Exception as e:
-                    print(f"Warning: BZArt enrichment failed: {e}", file=sys.stderr)
+                # the customer found above is still in memory; only read customer.json without one
+                customer_prompt = prompt_key if prompt_key is not None else _load_customer_prompt(run_dir)
+                # written is the path returned from write_markdown (string or Path)
+                _maybe_run_structured_output(Path(written), customer_prompt, run_dir)
             return 0
 
-        # 'all' engines - run parsers first, then QR (with heuristic fallback)
+        # 'all' engines - parsers and the first QR pass run concurrently, then the QR heuristic
         if parser_name == "all":
-            print("Running all parsers sequentially to avoid model conflicts...")
-            docling_runnable = RunnableLambda(lambda _: convert_pdf_trace(copied_pdf, "docling", False, run_dir), name="Docling Parser")
-            marker_runnable = RunnableLambda(lambda _: convert_pdf_trace(copied_pdf, "marker", use_llm, run_dir), name="Marker Parser")
+            print("Running parsers and QR scan concurrently (parser models one at a time)...")
 
             results = {}
             errors: list[tuple[str, Exception]] = []
+            markdowns = {}
+            qr_result = {"qr_result": None}
+
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                write_futures = {}
+                futures = {
+                    pool.submit(_convert_locked, copied_pdf, "docling", False, run_dir): "docling",
+                    pool.submit(_convert_locked, copied_pdf, "marker", use_llm, run_dir): "marker",
+                    # QR (try without heuristic first)
+                    pool.submit(scan_qr_trace, copied_pdf, run_dir, use_heuristic=False): "qr",
+                }
+                for fut in as_completed(futures):
+                    task = futures[fut]
+                    if task == "qr":
+                        try:
+                            qr_result = fut.result()
+                        except Exception as e:
+                            print(f"❌ QR scanning failed: {e}")
+                            errors.append(("qr", e))
+                        continue
+                    try:
+                        results[task] = fut.result()
+                        print(f"✅ {task.capitalize()} conversion completed")
+                    except Exception as e:
+                        print(f"❌ {task.capitalize()} conversion failed: {e}")
+                        errors.append((task, e))
+                        continue
+                    # write markdown outputs as they arrive (in the pool, concurrently with the
+                    # other tasks and each other) so heuristic can use them
+                    try:
+                        md = results[task]["markdown"]
+                        write_futures[pool.submit(write_markdown, run_dir, copied_pdf.stem, task, md)] = (task, md)
+                    except Exception as e:
+                        errors.append((f"{task}_output", e))
 
-            # 1. Docling
-            print("1/3: Running Docling conversion...")
-            try:
-                docling_result = docling_runnable.invoke(None, config={"callbacks": [handler]})
-                results["docling"] = docling_result
-                print("✅ Docling conversion completed")
-            except Exception as e:
-                print(f"❌ Docling conversion failed: {e}")
-                errors.append(("docling", e))
-
-            # 2. Marker
-            print("2/3: Running Marker conversion...")
-            try:
-                marker_result = marker_runnable.invoke(None, config={"callbacks": [handler]})
-                results["marker"] = marker_result
-                print("✅ Marker conversion completed")
-            except Exception as e:
-                print(f"❌ Marker conversion failed: {e}")
-                errors.append(("marker", e))
-
-            # write any markdown outputs so heuristic can use them
-            outputs = {}
-            if "docling" in results:
-                try:
-                    docling_md = results["docling"]["markdown"]
-                    written = write_markdown(run_dir, copied_pdf.stem, "docling", docling_md)
-                    print(f"Wrote: {written}")
-                    outputs["docling"] = docling_md
-                except Exception as e:
-                    errors.append(("docling_output", e))
-
-            if "marker" in results:
-                try:
-                    marker_md = results["marker"]["markdown"]
-                    written = write_markdown(run_dir, copied_pdf.stem, "marker", marker_md)
-                    print(f"Wrote: {written}")
-                    outputs["marker"] = marker_md
-                except Exception as e:
-                    errors.append(("marker_output", e))
+                for fut, (task, md) in write_futures.items():
+                    try:
+                        written = fut.result()
+                        print(f"Wrote: {written}")
+                        markdowns[task] = md
+                    except Exception as e:
+                        errors.append((f"{task}_output", e))
 
-            # 3. QR (try without heuristic first)
-            print("3/3: Scanning QR code...")
-            qr_runnable = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=False), name="QR Scanner")
-            try:
-                qr_result = qr_runnable.invoke(None, config={"callbacks": [handler]})
-            except Exception as e:
-                print(f"❌ QR scanning failed: {e}")
-                errors.append(("qr", e))
-                qr_result = {"qr_result": None}
+            # keep the docling, marker, qr key order of run_output.json
+            outputs = {engine: markdowns[engine] for engine in ("docling", "marker") if engine in markdowns}
 
-            # If no QR, retry with heuristic (markdown available)
-            if qr_result.get("qr_result") is None:
+            # If no QR, retry with heuristic (markdown available) unless nothing has a QR/IBAN token
+            if qr_result.get("qr_result") is None and _should_retry_qr_heuristic(*outputs.values()):
                 print("No QR found; retrying with heuristic based on generated markdown...")
-                qr_runnable_h = RunnableLambda(lambda _: scan_qr_trace(copied_pdf, run_dir, use_heuristic=True), name="QR Scanner (heuristic)")
                 try:
-                    qr_result = qr_runnable_h.invoke(None, config={"callbacks": [handler]})
+                    qr_result = scan_qr_trace(copied_pdf, run_dir, use_heuristic=True)
                 except Exception as e:
                     print(f"❌ QR heuristic scan failed: {e}")
                     errors.append(("qr_heuristic", e))
@@ -267,16 +439,16 @@ def run_processing(copied_pdf: Optional[Path], parser_name: str | None, use_llm:
                 if isinstance(outputs["qr"], dict) and outputs["qr"].get("invoice"):
                     # Normalize invoice payload and try IBAN lookup
                     search_val = _normalize_invoice_field(outputs["qr"]["invoice"])
-                    cust = get_customer_by_iban(search_val)
+                    cust = _lookup_customer(search_val)
                     if not cust:
                         print("Error: customer not found by IBAN. Aborting.", file=sys.stderr)
                         return 5
                     cust_out = run_dir / "customer.json"
-                    cust_out.write_text(json.dumps(cust, ensure_ascii=False, indent=4), encoding="utf-8")
+                    _atomic_write_json(cust_out, cust)
                     prompt_key = choose_prompt(cust)
 
             out_json = run_dir / "run_output.json"
-            out_json.write_text(json.dumps(outputs, ensure_ascii=False, indent=4), encoding="utf-8")
+            _atomic_write_json(out_json, outputs)
             print(f"Wrote structured output: {out_json}")
 
             if errors:
@@ -1,11 +1,22 @@
 from __future__ import annotations
 from enum import Enum
-from typing import Optional, List
-from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Shared by all invoice models: validators/serializers are compiled on first use instead of at
+# import (short CLI runs that never validate skip it); extra keys are dropped, strings stripped.
+_MODEL_CONFIG = ConfigDict(defer_build=True, extra="ignore", str_strip_whitespace=True, arbitrary_types_allowed=False)
 
 # Add this datatype only if there is no QR detection
 class PaymentInformation(BaseModel):
     """Payment information block (creditor details, IBAN, etc.)."""
+    model_config = _MODEL_CONFIG
+
     creditor_name: Optional[str] = Field(None, description="Name of the creditor/payee.")
     street: Optional[str] = Field(None, description="Street address of the creditor.")
     city_zip: Optional[str] = Field(None, description="City and postal code of the creditor. Swiss ZIP codes are 4 digits.")
@@ -16,12 +27,16 @@ class PaymentInformation(BaseModel):
 # Add this datatype only if there is no QR detection
 class Provider(BaseModel):
     """Provider/issuer of the invoice (company issuing the invoice)."""
+    model_config = _MODEL_CONFIG
+
     name: Optional[str] = Field(None, description="Provider name (company). Must include name and VAT number.")
     address_line1: Optional[str] = Field(None, description="Primary address line of the provider.")
     city_zip: Optional[str] = Field(None, description="City and postal code for the provider. Swiss ZIP codes are 4 digits.")
 
 class Header(BaseModel):
     """Top-level invoice header information."""
+    model_config = ConfigDict(**_MODEL_CONFIG, use_enum_values=True)
+
     invoice_number: Optional[int] = Field(None, description="Invoice number as numeric value only.")
     invoice_date: Optional[str] = Field(None, description="Invoice date in exact format: dd.mm.yyyy")
     due_date: Optional[str] = Field(None, description="Payment due date in exact format: dd.mm.yyyy")
@@ -45,6 +60,9 @@ class Header(BaseModel):
     #provider: Optional[Provider] = Field(None, description="Provider/issuer company details.")
     #payment_information: Optional[PaymentInformation] = Field(None, description="Payment and creditor details.")
 
+# Exact values already resolve in O(1): Enum keeps a value -> member dict and pydantic-core
+# checks enum fields against its own lookup table, so a _missing_ fast path would never run
+# for a valid value. Near misses ('energie ', 'e') are rejected on purpose.
 class Category(str, Enum):
     """Category classification for a line item."""
     energie = "Energie"
@@ -65,6 +83,8 @@ class Utility(str, Enum):
 
 class LineItem(BaseModel):
     """Single invoice line item. Extract each item individually, never summarize."""
+    model_config = ConfigDict(**_MODEL_CONFIG, use_enum_values=True)
+
     line_items_description: Optional[str] = Field(None, description="Line item description exactly as shown")
     delivery_period: Optional[str] = Field(None, description="Service/delivery period in format: dd.mm.yyyy-dd.mm.yyyy with zero whitespace. Example: '01.03.2024-31.03.2024'")
     quantity: Optional[float] = Field(None, description="Measured quantity for this line item.")
@@ -86,7 +106,55 @@ class LineItem(BaseModel):
     VS_Adr: Optional[str] = Field(None, description="Supply address - street and number only (e.g., 'Wehrstrasse 47'). Do not include city or postal code.")
     VS_Ort: Optional[str] = Field(None, description="Supply location - city with 4-digit Swiss postal code (e.g., '3203 Mühleberg'). Non-Swiss locations may have different postal code lengths.")
 
+# LineItem fields materialized as float64 columns (None -> NaN / null); all others are strings
+_NUMERIC_LINE_ITEM_FIELDS = frozenset(
+    ("quantity", "unit_price", "total_price", "vat_amount", "vat_rate", "total_price_incl_vat")
+)
+
+def _column_value(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
 class EnergyBill(BaseModel):
-    """Top-level energy invoice schema containing header and line items."""
+    """
+    Top-level energy invoice schema containing header and line items.
+
+    line_items (one model per row) stays the primary interface; code that aggregates single
+    columns (sums of total_price, VAT rates, ...) should use to_columns()/to_arrow() instead.
+    """
+    model_config = _MODEL_CONFIG
+
     header: Optional[Header] = Field(None, description="Invoice header containing totals and provider info.")
-    line_items: Optional[List[LineItem]] = Field(None, description="List of individual line items on the invoice.")
\ No newline at end of file
+    line_items: Optional[List[LineItem]] = Field(None, description="List of individual line items on the invoice.")
+
+    def to_columns(self) -> Dict[str, Any]:
+        """
+        Line items as one numpy array per LineItem field (float64 with NaN for missing numbers,
+        object arrays of str/None otherwise). Built from the current line_items on every call.
+        """
+        if np is None:
+            raise ImportError("EnergyBill.to_columns requires numpy")
+        items = self.line_items or []
+        columns = {}
+        for name in LineItem.model_fields:
+            values = [_column_value(getattr(item, name, None)) for item in items]
+            if name in _NUMERIC_LINE_ITEM_FIELDS:
+                columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            else:
+                columns[name] = np.array(values, dtype=object)
+        return columns
+
+    def to_arrow(self):
+        """Line items as a pyarrow.Table (float64 amounts, string text fields; missing -> null)."""
+        try:
+            import pyarrow as pa  # optional, only needed for this export
+        except Exception:
+            raise ImportError("EnergyBill.to_arrow requires pyarrow") from None
+
+        items = self.line_items or []
+        return pa.table({
+            name: pa.array(
+                [_column_value(getattr(item, name, None)) for item in items],
+                type=pa.float64() if name in _NUMERIC_LINE_ITEM_FIELDS else pa.string(),
+            )
+            for name in LineItem.model_fields
+        })
\ No newline at end of file
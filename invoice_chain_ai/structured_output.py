@@ -1,11 +1,18 @@
 from __future__ import annotations
+import asyncio
+import functools
+import json
+import mmap
+import re
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence, Union
 
 # Updated imports for modern LangChain
 from langchain_core.messages import HumanMessage, SystemMessage
-from .structure import EnergyBill
+from .structure import EnergyBill, Header, LineItem
+from .io_utils import ALL_MARKDOWN_TOKENS, _dumps, _loads, scan_markdown_tokens
 from langchain_openai import ChatOpenAI
+import openai
 import os
 
 SYSTEM_PROMPT = """
@@ -33,45 +40,258 @@ def _default_system_message() -> str:
     """Return the embedded system prompt."""
     return SYSTEM_PROMPT
 
-def run_structured_output_modern(markdown_path: Path, customer_prompt: Optional[str] = None, run_dir: Optional[Path] = None) -> Dict[str, Any]:
+# Messages are never mutated, so every request shares the one system message
+_SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+# Console tracing of the LLM calls prints every prompt, so it is opt-in (INVOICE_CHAIN_TRACE=1).
+# The flag is read per call: cli loads .env only after importing this module. Both configs are
+# built once; LangChain copies configs before use, so the shared dicts are never mutated.
+_NO_CALLBACKS: Dict[str, Any] = {}
+
+@functools.lru_cache(maxsize=1)
+def _trace_config() -> Dict[str, Any]:
+    from langchain_core.tracers import ConsoleCallbackHandler
+    return {"callbacks": [ConsoleCallbackHandler()]}
+
+def _callback_config() -> Dict[str, Any]:
+    return _trace_config() if os.environ.get("INVOICE_CHAIN_TRACE") else _NO_CALLBACKS
+
+_TEMPERATURE = 0
+
+# Transient API errors worth another attempt. Parser/validation errors and other 4xx answers
+# (e.g. context_length_exceeded) would fail the same way again at full token cost.
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+def _model_name() -> str:
+    return os.environ.get("STRUCTURED_OUTPUT_MODEL", "gpt-5-mini")
+
+def _json_mode() -> bool:
+    """STRUCTURED_OUTPUT_METHOD=json_mode: plain JSON response parsed by pydantic-core (jiter)."""
+    return os.environ.get("STRUCTURED_OUTPUT_METHOD", "").strip().lower() == "json_mode"
+
+def llm_settings() -> Dict[str, Any]:
+    """Settings that shape a structured-output answer; part of any cache key built on prompts."""
+    return {"model": _model_name(), "temperature": _TEMPERATURE, "json_mode": _json_mode()}
+
+@functools.lru_cache(maxsize=1)
+def _json_mode_system_message() -> SystemMessage:
+    # json_mode does not send the schema to the model, so the prompt has to carry it
+    schema = json.dumps(EnergyBill.model_json_schema(), ensure_ascii=False)
+    return SystemMessage(content=f"{SYSTEM_PROMPT}\n## EnergyBill JSON Schema\n{schema}\n")
+
+def _parse_energy_bill(message: Any) -> EnergyBill:
+    # model_validate_json parses with pydantic-core's jiter, no json.loads dict in between
+    return EnergyBill.model_validate_json(message.content, strict=False)
+
+@functools.lru_cache(maxsize=1)
+def _build_energy_bill() -> None:
+    # the models use defer_build; compile them once here, on first structured-output use
+    EnergyBill.model_rebuild()
+
+def _with_energy_bill_output(llm: ChatOpenAI, json_mode: bool):
+    _build_energy_bill()
+    if json_mode:
+        return llm.bind(response_format={"type": "json_object"}) | _parse_energy_bill
+    return llm.with_structured_output(EnergyBill)
+
+def create_chat_model(**kwargs: Any) -> ChatOpenAI:
     """
-    Modern approach using ChatOpenAI with structured output (recommended).
-    Requires langchain-openai package.
+    ChatOpenAI configured for structured output. Extra kwargs go to ChatOpenAI, e.g. a shared
+    http_async_client so concurrent async calls reuse one connection pool.
     """
-    system_msg = _default_system_message()
-
-    model_name = os.environ.get("STRUCTURED_OUTPUT_MODEL", "gpt-5-mini")
-    llm = ChatOpenAI(
-        model=model_name,
-        temperature=0
+    return ChatOpenAI(
+        model=_model_name(),
+        temperature=_TEMPERATURE,
+        **kwargs,
     )
-    
-    # Use with_structured_output for automatic JSON parsing
-    structured_llm = llm.with_structured_output(EnergyBill)
-    
-    # Read markdown content
-    with open(markdown_path, "r", encoding="utf-8") as f:
-        context = f.read()
 
-    # Create messages
-    messages = [
-        SystemMessage(content=system_msg),
-        HumanMessage(content=f"""
-        Instructions: {customer_prompt}
+# Above this size the markdown is decoded straight from a memory map (no bytes copy first)
+_MMAP_THRESHOLD = 1 << 20
 
-        Invoice markdown:
-        {context}
+def _read_markdown(markdown_path: Path) -> str:
+    with open(markdown_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                context = str(mm, "utf-8")
+        else:
+            context = f.read().decode("utf-8")
+    # same result as the former text-mode read (universal newlines)
+    if "\r" in context:
+        context = context.replace("\r\n", "\n").replace("\r", "\n")
+    return context
 
-        """)
+# Markdown noise that costs input tokens but carries no invoice data
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)|<!--\s*image\s*-->|data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+")
+_BLANK_RUN_RE = re.compile(r"\n[ \t]*(?:\n[ \t]*)+\n")
+# Above this size only blocks that look invoice-relevant (any scan_markdown_tokens hit) are kept
+_PRUNE_THRESHOLD = 40_000
+
+def _prune_markdown(context: str) -> str:
+    """
+    Drop image references / base64 blobs and collapse blank-line runs. Very long markdown is
+    further reduced to its first block, all table blocks and the blocks mentioning amounts,
+    quantities, meters, periods, dates or payment details (QR header, IBAN, VAT number).
+    """
+    pruned = _BLANK_RUN_RE.sub("\n\n", _IMAGE_RE.sub("", context))
+    if len(pruned) > _PRUNE_THRESHOLD:
+        blocks = pruned.split("\n\n")
+        pruned = "\n\n".join(
+            [blocks[0]]
+            + [b for b in blocks[1:] if b.lstrip().startswith("|") or scan_markdown_tokens(b, ALL_MARKDOWN_TOKENS)]
+        )
+    if len(pruned) != len(context):
+        print(f"Markdown pruned for structured output: {len(context)} -> {len(pruned)} chars")
+    return pruned
+
+def _build_messages(
+    markdown_path: Path,
+    customer_prompt: Optional[str],
+    context: Optional[str] = None,
+    json_mode: bool = False,
+    prune: bool = False,
+) -> list:
+    # Read markdown content (unless the caller already has it)
+    if context is None:
+        context = _read_markdown(markdown_path)
+    # only invoice markdown is pruned; other inputs (e.g. the BZArt prompt) are sent as written
+    if prune:
+        context = _prune_markdown(context)
+
+    # Create messages
+    return [
+        _json_mode_system_message() if json_mode else _SYSTEM_MESSAGE,
+        HumanMessage(content="".join((
+            "\n        Instructions: ", str(customer_prompt),
+            "\n\n        Invoice markdown:\n        ", context,
+            "\n\n        ",
+        )))
     ]
-    
-    # Get structured output
-    result = structured_llm.invoke(messages)
-    
+
+@functools.lru_cache(maxsize=None)
+def _structured_llm(model_name: str, json_mode: bool = False):
+    """ChatOpenAI + EnergyBill structured-output runnable, built (schema included) once per model."""
+    return _with_energy_bill_output(ChatOpenAI(model=model_name, temperature=_TEMPERATURE), json_mode)
+
+def _to_dict(result: Any) -> Dict[str, Any]:
     # Convert to dict if it's a Pydantic model
     if hasattr(result, "model_dump"):
         return result.model_dump()
     elif hasattr(result, "dict"):
         return result.dict()
     else:
-        return result
\ No newline at end of file
+        return result
+
+def dump_structured_output(result: Any) -> bytes:
+    """
+    Indented JSON bytes for a structured-output result. EnergyBill models are serialized by
+    Pydantic's Rust serializer in one pass (no model_dump() dict in between).
+    """
+    if hasattr(result, "model_dump_json"):
+        return result.model_dump_json(indent=2).encode("utf-8")
+    return _dumps(result)
+
+def run_structured_output_modern(
+    markdown_path: Path,
+    customer_prompt: Optional[str] = None,
+    run_dir: Optional[Path] = None,
+    as_model: bool = False,
+    prune: bool = False,
+) -> Union[EnergyBill, Dict[str, Any]]:
+    """
+    Modern approach using ChatOpenAI with structured output (recommended).
+    Requires langchain-openai package. With as_model=True the EnergyBill itself is returned
+    (write it with dump_structured_output); otherwise a dict. Pass prune=True for invoice
+    markdown to drop images and (when very long) irrelevant blocks before sending it.
+    """
+    # Use with_structured_output for automatic JSON parsing; reused across calls
+    json_mode = _json_mode()
+    structured_llm = _structured_llm(_model_name(), json_mode)
+    
+    messages = _build_messages(markdown_path, customer_prompt, json_mode=json_mode, prune=prune)
+    
+    # Get structured output
+    result = structured_llm.invoke(messages, config=_callback_config())
+    
+    return result if as_model else _to_dict(result)
+
+async def run_structured_output_modern_async(
+    markdown_path: Path,
+    customer_prompt: Optional[str] = None,
+    run_dir: Optional[Path] = None,
+    llm: Optional[ChatOpenAI] = None,
+    as_model: bool = False,
+    prune: bool = False,
+) -> Union[EnergyBill, Dict[str, Any]]:
+    """
+    Async variant of run_structured_output_modern. Pass `llm` (see create_chat_model) to share
+    one client across concurrent calls.
+    """
+    if llm is None:
+        llm = create_chat_model()
+    json_mode = _json_mode()
+    structured_llm = _with_energy_bill_output(llm, json_mode)
+    # read the markdown off the event loop so concurrent calls keep overlapping
+    context = await asyncio.to_thread(_read_markdown, markdown_path)
+    messages = _build_messages(markdown_path, customer_prompt, context, json_mode=json_mode, prune=prune)
+    result = await structured_llm.ainvoke(messages, config=_callback_config())
+    return result if as_model else _to_dict(result)
+
+async def run_structured_output_modern_batch(
+    markdown_paths: Sequence[Path],
+    customer_prompts: Sequence[Optional[str]],
+    llm: Optional[ChatOpenAI] = None,
+    max_concurrency: int = 8,
+    as_model: bool = False,
+    prune: bool = False,
+) -> List[Union[EnergyBill, Dict[str, Any], Exception]]:
+    """
+    Structured output for several invoices in one abatch() call, at most `max_concurrency`
+    requests in flight. Each request is retried (exponential backoff with jitter) on rate limits,
+    timeouts, connection and server errors only. Results are in input order; a failed invoice yields its exception
+    instead of failing the whole batch.
+    """
+    if len(markdown_paths) != len(customer_prompts):
+        raise ValueError("markdown_paths and customer_prompts must have the same length")
+    if llm is None:
+        llm = create_chat_model()
+    json_mode = _json_mode()
+    structured_llm = _with_energy_bill_output(llm, json_mode).with_retry(
+        retry_if_exception_type=_RETRYABLE_ERRORS, stop_after_attempt=3, wait_exponential_jitter=True
+    )
+    contexts = await asyncio.gather(*(asyncio.to_thread(_read_markdown, p) for p in markdown_paths))
+    all_messages = [
+        _build_messages(p, prompt, context, json_mode=json_mode, prune=prune)
+        for p, prompt, context in zip(markdown_paths, customer_prompts, contexts)
+    ]
+    results = await structured_llm.abatch(
+        all_messages, config={**_callback_config(), "max_concurrency": max_concurrency}, return_exceptions=True
+    )
+    return [r if as_model or isinstance(r, Exception) else _to_dict(r) for r in results]
+
+def load_energy_bill(path: Path) -> EnergyBill:
+    """
+    Load a structured output this pipeline wrote itself (raw_structured_output.json) back into
+    an EnergyBill without re-validating it.
+
+    TRUSTED DATA ONLY: model_construct skips all validation and coercion (enum fields stay
+    plain strings), so use it solely for files produced from an already validated EnergyBill.
+    Anything edited by hand or from outside goes through EnergyBill.model_validate instead.
+    """
+    raw = Path(path).read_bytes()
+    data = _loads(raw)
+    header = data.get("header")
+    line_items = data.get("line_items")
+    return EnergyBill.model_construct(
+        header=Header.model_construct(**header) if isinstance(header, dict) else header,
+        line_items=(
+            [LineItem.model_construct(**item) if isinstance(item, dict) else item for item in line_items]
+            if isinstance(line_items, list)
+            else line_items
+        ),
+    )
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("fitz", "cv2", "docling", "marker")
+
+_CHECK = """
+import sys
+{setup}
+loaded = sorted(m for m in {heavy!r} if m in sys.modules)
+assert not loaded, f"heavy modules imported: {{loaded}}"
+"""
+
+
+def _run(setup: str) -> subprocess.CompletedProcess:
+    code = _CHECK.format(setup=setup, heavy=HEAVY_MODULES)
+    return subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True)
+
+
+def test_importing_cli_does_not_load_heavy_modules():
+    proc = _run("import invoice_chain_ai.cli")
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_cli_help_does_not_load_heavy_modules():
+    proc = _run(
+        "from invoice_chain_ai.cli import run_cli\n"
+        "try:\n"
+        "    run_cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass"
+    )
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_main_help_does_not_load_heavy_modules():
+    pytest.importorskip("dotenv")
+    proc = _run(
+        "from invoice_chain_ai.main import main\n"
+        "try:\n"
+        "    main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass"
+    )
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,72 @@
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+
+from invoice_chain_ai.db import db_client
+
+
+@pytest.fixture
+def init_sql(tmp_path: Path, monkeypatch):
+    path = tmp_path / "init.sql"
+    monkeypatch.setattr(db_client, "DB_INIT_SQL", str(path))
+    db_client._read_init_sql.cache_clear()
+    db_client._schema_version.cache_clear()
+    yield path
+    db_client._read_init_sql.cache_clear()
+    db_client._schema_version.cache_clear()
+
+
+def test_schema_version_follows_init_sql(init_sql: Path):
+    init_sql.write_text("CREATE TABLE a (id INT);", encoding="utf-8")
+    first = db_client._schema_version()
+    assert 0 <= first < 2**31
+
+    init_sql.write_text("CREATE TABLE a (id INT, name TEXT);", encoding="utf-8")
+    db_client._read_init_sql.cache_clear()
+    db_client._schema_version.cache_clear()
+    assert db_client._schema_version() != first
+
+
+def test_schema_version_without_init_sql_uses_fallback_ddl(init_sql: Path):
+    assert db_client._schema_sql() == db_client._FALLBACK_SCHEMA_SQL
+    assert 0 <= db_client._schema_version() < 2**31
+
+
+@pytest.fixture
+def pg_conn():
+    """Connection with the fallback schema in a throwaway Postgres schema (needs DATABASE_URL)."""
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL not set")
+    psycopg = pytest.importorskip("psycopg")
+    from psycopg.rows import dict_row
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(os.environ["DATABASE_URL"], row_factory=dict_row) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+        conn.execute(f"SET search_path TO {schema}")
+        conn.execute(db_client._FALLBACK_SCHEMA_SQL)
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            conn.commit()
+
+
+def _add_customer(conn, name, ibans=()):
+    row = conn.execute(
+        "INSERT INTO customers (name, ibans) VALUES (%s, %s) RETURNING id", (name, list(ibans))
+    ).fetchone()
+    return row["id"]
+
+
+def test_iban_lookup_normalizes_and_matches_iban_only(pg_conn):
+    by_iban = _add_customer(pg_conn, "Other AG", ibans=["CH9300762011623852957"])
+
+    find = db_client._find_customer_by_iban
+    assert find(pg_conn, "CH93 0076 2011 6238 5295 7")["id"] == by_iban
+    assert find(pg_conn, "CH0000000000000000000") is None
+    assert find(pg_conn, "") is None
+
@@ -0,0 +1,203 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from invoice_chain_ai import io_utils
+
+
+def test_atomic_write_replaces_target(tmp_path: Path):
+    target = tmp_path / "run_output.json"
+    target.write_bytes(b"old")
+    io_utils.atomic_write(target, b'{"new": true}')
+    assert target.read_bytes() == b'{"new": true}'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["run_output.json"]
+
+
+def test_atomic_write_leaves_no_temp_file_on_failure(tmp_path: Path, monkeypatch):
+    target = tmp_path / "customer.json"
+    target.write_bytes(b"old")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(io_utils.os, "replace", fail)
+    with pytest.raises(OSError):
+        io_utils.atomic_write(target, b"new")
+    assert target.read_bytes() == b"old"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["customer.json"]
+
+
+def test_write_markdown_writes_text(tmp_path: Path):
+    out = io_utils.write_markdown(tmp_path, "invoice", "docling", "# Rechnung\nä")
+    assert out == tmp_path / "invoice.docling.md"
+    assert out.read_text(encoding="utf-8") == "# Rechnung\nä"
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_dumps_round_trips_non_str_keys_and_unicode():
+    raw = io_utils._dumps({"Zähler": 1, 2: [1.5, None]})
+    assert isinstance(raw, bytes)
+    assert "Zähler".encode("utf-8") in raw
+    assert io_utils._loads(raw) == {"Zähler": 1, "2": [1.5, None]}
+    assert raw.splitlines()[1].startswith(b"  \"")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Konto CH9300762011623852957",
+        "Konto CH93 0076 2011 6238 5295 7",
+        "Konto CH93  0076  2011  6238  5295  7",
+        "Konto ch93 0076\t2011 6238 5295 7",
+        "Konto CH 93 0076 2011 6238 5295 7",
+        "Konto\nCH93\n0076 2011 6238 5295 7\n",
+    ],
+)
+def test_iban_token_accepts_every_heuristic_iban(tmp_path: Path, text: str):
+    (tmp_path / "invoice.docling.md").write_text(text, encoding="utf-8")
+    assert io_utils.find_iban_in_markdown(tmp_path) == "CH9300762011623852957"
+    assert io_utils.TOKEN_IBAN_NUMBER in io_utils.scan_markdown_tokens(text)
+
+
+def test_iban_token_ignores_chf_amounts(tmp_path: Path):
+    text = "Total CHF 123.45 inkl. MWST"
+    (tmp_path / "invoice.docling.md").write_text(text, encoding="utf-8")
+    assert io_utils.find_iban_in_markdown(tmp_path) is None
+    assert io_utils.TOKEN_IBAN_NUMBER not in io_utils.scan_markdown_tokens(text)
+
+
+_TOKEN_SAMPLES = [
+    "",
+    "SPC\r\n0200\r\n1\r\nCH4431999123000889012\r\n",
+    "UID CHE-123.456.789 MWST",
+    # "SPC" and the IBAN-like "CH12" overlap: both must be reported
+    "SPCH12 0076",
+    "| Zähler | Période | Quantità |\n| 123 | 01.01.2024 | 12 kWh |",
+    "ZÄHLER PÉRIODE iban",
+    "Nothing relevant here.",
+    "Konto CH93  0076  2011  6238  5295  7",
+]
+
+
+@pytest.mark.parametrize("text", _TOKEN_SAMPLES)
+@pytest.mark.parametrize("wanted", [None, frozenset((io_utils.TOKEN_SPC, io_utils.TOKEN_IBAN_NUMBER))])
+def test_scan_backends_agree(text: str, wanted):
+    if io_utils.hyperscan is None:
+        pytest.skip("hyperscan not installed")
+    from_re = io_utils._scan_with_re(text, wanted)
+    from_hs = io_utils._scan_with_hyperscan(text.encode("utf-8"), wanted)
+    if wanted is None:
+        assert from_re == from_hs
+    else:
+        assert bool(from_re & wanted) == bool(from_hs & wanted)
+
+
+def test_scan_with_re_reports_overlapping_tokens():
+    found = io_utils._scan_with_re("SPCH12 0076", None)
+    assert found == {io_utils.TOKEN_SPC, io_utils.TOKEN_IBAN_NUMBER}
+
+
+def test_hyperscan_scratch_is_per_thread():
+    if io_utils.hyperscan is None:
+        pytest.skip("hyperscan not installed")
+    import threading
+
+    text = _TOKEN_SAMPLES[4] * 2000
+    expected = io_utils._scan_with_hyperscan(text.encode("utf-8"), None)
+    results = []
+
+    def worker():
+        for _ in range(20):
+            results.append(io_utils.scan_markdown_tokens(text))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [expected] * 80
+
+
+def test_scan_windows_cover_the_file_exactly_once(tmp_path: Path):
+    text = "".join(f"Zeile {i}: Zähler, Betrag CHF {i}.00\n" for i in range(200))
+    path = tmp_path / "long.md"
+    path.write_text(text, encoding="utf-8")
+    windows = list(io_utils._scan_windows(path, size=256, overlap=64))
+    assert len(windows) > 1
+    assert "".join(chunk[start:stop] for chunk, start, stop in windows) == text
+
+
+@pytest.mark.parametrize("offset", range(160, 260, 7))
+def test_chunked_scan_finds_iban_across_chunk_boundaries(tmp_path: Path, offset: int):
+    iban = "CH93 0076 2011 6238 5295 7"
+    text = "x " * (offset // 2) + f"IBAN {iban}\n" + "Rechnung\n" * 100
+    path = tmp_path / "invoice.docling.md"
+    path.write_text(text, encoding="utf-8")
+    windows = io_utils._scan_windows(path, size=256, overlap=64)
+    assert io_utils._find_iban_in_windows(windows) == "CH9300762011623852957"
+
+
+def test_find_iban_in_markdown(tmp_path: Path):
+    (tmp_path / "a.docling.md").write_text("Rechnung ohne Konto", encoding="utf-8")
+    assert io_utils.find_iban_in_markdown(tmp_path) is None
+    (tmp_path / "b.marker.md").write_text("Konto: ch93 0076 2011 6238 5295 7.", encoding="utf-8")
+    assert io_utils.find_iban_in_markdown(tmp_path) == "CH9300762011623852957"
+    assert io_utils.find_iban_in_markdown(tmp_path / "missing") is None
+
+
+def test_unique_outdir_numbers_after_the_highest_run(tmp_path: Path):
+    pdf = tmp_path / "inbox" / "bill.pdf"
+    base = tmp_path / "runs"
+    assert io_utils.unique_outdir(base, pdf) == base / "inbox_bill"
+
+    base.mkdir()
+    (base / "inbox_bill").mkdir()
+    assert io_utils.unique_outdir(base, pdf) == base / "inbox_bill_2"
+
+    for name in ("inbox_bill_2", "inbox_bill_5", "inbox_bill_old", "inbox_bill_copy_9", "inbox_bill_²", "other_bill_12"):
+        (base / name).mkdir()
+    # a gap (3, 4) is not reused: numbering continues after the newest run
+    assert io_utils.unique_outdir(base, pdf) == base / "inbox_bill_6"
+
+
+def _pdf(tmp_path: Path) -> Path:
+    src = tmp_path / "inbox" / "bill.pdf"
+    src.parent.mkdir()
+    src.write_bytes(b"%PDF-1.7\n" + bytes(range(256)) * 64)
+    os.utime(src, (1_700_000_000, 1_700_000_000))
+    return src
+
+
+def test_copy_pdf_to_run_keeps_content_and_mtime(tmp_path: Path):
+    src = _pdf(tmp_path)
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    dest = io_utils.copy_pdf_to_run(src, run_dir)
+    assert dest == run_dir / "bill.pdf"
+    assert dest.read_bytes() == src.read_bytes()
+    assert dest.stat().st_mtime == src.stat().st_mtime
+
+
+def test_copy_pdf_to_run_falls_back_when_clone_is_unsupported(tmp_path: Path, monkeypatch):
+    fcntl = pytest.importorskip("fcntl")
+
+    def no_reflink(*args):
+        raise OSError(95, "Operation not supported")
+
+    monkeypatch.setattr(fcntl, "ioctl", no_reflink)
+    src = _pdf(tmp_path)
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    assert io_utils._clone_file(src, run_dir / "bill.pdf") is False
+    assert io_utils.copy_pdf_to_run(src, run_dir).read_bytes() == src.read_bytes()
+
+
+def test_copy_pdf_onto_itself_leaves_the_source_intact(tmp_path: Path):
+    src = _pdf(tmp_path)
+    content = src.read_bytes()
+    assert io_utils._clone_file(src, src) is False
+    with pytest.raises(shutil.SameFileError):
+        io_utils.copy_pdf_to_run(src, src.parent)
+    assert src.read_bytes() == content
@@ -0,0 +1,170 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("langsmith")
+
+from invoice_chain_ai import postprocess_bz
+from invoice_chain_ai.io_utils import _dumps, _loads
+
+
+@pytest.fixture
+def cache_db(tmp_path: Path, monkeypatch):
+    path = tmp_path / "cache" / "bz.sqlite3"
+    monkeypatch.setenv("BZ_CACHE_DB", str(path))
+    monkeypatch.setattr(postprocess_bz, "_cache_conn", None)
+    yield path
+    if postprocess_bz._cache_conn is not None and postprocess_bz._cache_conn[1] is not None:
+        postprocess_bz._cache_conn[1].close()
+
+
+class _FakeLLM:
+    """Stands in for run_structured_output_modern: records prompts, returns canned answers."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def __call__(self, prompt_md, customer_prompt, run_dir):
+        self.prompts.append(Path(prompt_md).read_text(encoding="utf-8"))
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def _invoice(tmp_path: Path, name: str, *descriptions: str):
+    run_dir = tmp_path / name
+    run_dir.mkdir()
+    raw = {
+        "invoice_language": "de",
+        "line_items": [{"description": d, "quantity_unit": "kWh", "category": "energy"} for d in descriptions],
+    }
+    path = run_dir / "raw_structured_output.json"
+    path.write_bytes(_dumps(raw))
+    return path, run_dir
+
+
+def _bz_arts(run_dir: Path):
+    enriched = _loads((run_dir / "raw_structured_output_enriched.json").read_bytes())
+    return [li["BZArt"] for li in enriched["line_items"]]
+
+
+def test_batch_predictions_are_cached_under_the_batch_prompt(tmp_path: Path, cache_db, monkeypatch):
+    first = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+    second = _invoice(tmp_path, "b", "Arbeit Niedertarif", "Grundtarif")
+    llm = _FakeLLM({"invoice_1": ["HT"], "invoice_2": ["NT", "DL_Geb"]}, {"result": ["NT", "DL_Geb"]})
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern", llm)
+    paths, run_dirs = [p for p, _ in (first, second)], [d for _, d in (first, second)]
+
+    postprocess_bz.enrich_bz_art_batch(paths, run_dirs)
+    assert _bz_arts(run_dirs[0]) == ["HT"] and _bz_arts(run_dirs[1]) == ["NT", "DL_Geb"]
+    assert len(llm.prompts) == 1
+
+    # the same batch again is answered from the cache
+    postprocess_bz.enrich_bz_art_batch(paths, run_dirs)
+    assert len(llm.prompts) == 1
+
+    # an invoice enriched on its own does not reuse the answer it got inside the batch
+    postprocess_bz.enrich_bz_art(paths[1], run_dirs[1])
+    assert len(llm.prompts) == 2
+    assert "Invoice 1" not in llm.prompts[1]
+
+
+def test_failed_batch_marks_every_invoice(tmp_path: Path, cache_db, monkeypatch):
+    first = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+    second = _invoice(tmp_path, "b", "Grundtarif")
+    llm = _FakeLLM(RuntimeError("rate limited"), {"invoice_1": ["HT"], "invoice_2": ["DL_Geb"]})
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern", llm)
+    paths, run_dirs = [first[0], second[0]], [first[1], second[1]]
+
+    postprocess_bz.enrich_bz_art_batch(paths, run_dirs)
+    for run_dir in run_dirs:
+        assert _bz_arts(run_dir) == ["UNKNOWN"]
+        assert (run_dir / postprocess_bz._STATUS_FILE).exists()
+
+    # nothing was cached for the failed call, so a retry asks the LLM again
+    postprocess_bz.enrich_bz_art_batch(paths, run_dirs)
+    assert len(llm.prompts) == 2
+    assert _bz_arts(run_dirs[1]) == ["DL_Geb"]
+    assert not (run_dirs[1] / postprocess_bz._STATUS_FILE).exists()
+
+
+def test_sync_and_async_classify_share_the_cache(tmp_path: Path, cache_db, monkeypatch):
+    path, run_dir = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+    calls = []
+
+    async def fake_async(prompt_md, customer_prompt, run_dir, llm=None):
+        calls.append(prompt_md)
+        return {"result": ["HT"]}
+
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern_async", fake_async)
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern", _FakeLLM())
+
+    asyncio.run(postprocess_bz.enrich_bz_art_async(path, run_dir))
+    assert _bz_arts(run_dir) == ["HT"] and len(calls) == 1
+    assert (run_dir / "bz_prompt.md").exists()
+
+    # the sync path finds the prediction the async path stored (_FakeLLM() has no answers)
+    postprocess_bz.enrich_bz_art(path, run_dir)
+    assert _bz_arts(run_dir) == ["HT"]
+
+
+def test_async_classify_failure_marks_the_run(tmp_path: Path, cache_db, monkeypatch):
+    path, run_dir = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+
+    async def failing(prompt_md, customer_prompt, run_dir, llm=None):
+        raise TimeoutError
+
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern_async", failing)
+    asyncio.run(postprocess_bz.enrich_bz_art_async(path, run_dir))
+    assert _bz_arts(run_dir) == ["UNKNOWN"]
+    assert (run_dir / postprocess_bz._STATUS_FILE).exists()
+
+
+def test_cache_round_trip(cache_db):
+    key = postprocess_bz._prompt_key(b"prompt")
+    assert postprocess_bz._cache_get(key) is None
+    postprocess_bz._cache_put(key, ["HT", "Zähler"])
+    assert postprocess_bz._cache_get(key) == ["HT", "Zähler"]
+    assert cache_db.exists()
+
+
+def test_cache_key_follows_llm_settings(cache_db, monkeypatch):
+    key = postprocess_bz._prompt_key(b"prompt")
+    postprocess_bz._cache_put(key, ["HT"])
+    settings = dict(postprocess_bz.llm_settings(), model="another-model")
+    monkeypatch.setattr(postprocess_bz, "llm_settings", lambda: settings)
+    other = postprocess_bz._prompt_key(b"prompt")
+    assert other != key
+    assert postprocess_bz._cache_get(other) is None
+
+
+def test_empty_cache_db_disables_the_cache(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("BZ_CACHE_DB", "")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    monkeypatch.setattr(postprocess_bz, "_cache_conn", None)
+    path, run_dir = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+    llm = _FakeLLM({"result": ["HT"]}, {"result": ["HT"]})
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern", llm)
+
+    postprocess_bz.enrich_bz_art(path, run_dir)
+    postprocess_bz.enrich_bz_art(path, run_dir)
+    assert len(llm.prompts) == 2
+    assert not (tmp_path / "xdg").exists()
+
+
+def test_cache_is_reused_across_calls(tmp_path: Path, cache_db, monkeypatch):
+    path, run_dir = _invoice(tmp_path, "a", "Arbeit Hochtarif")
+    llm = _FakeLLM({"result": ["HT"]})
+    monkeypatch.setattr(postprocess_bz, "run_structured_output_modern", llm)
+
+    postprocess_bz.enrich_bz_art(path, run_dir)
+    # a new process (fresh connection) reads the answer back from the same file
+    postprocess_bz._cache_conn[1].close()
+    monkeypatch.setattr(postprocess_bz, "_cache_conn", None)
+    postprocess_bz.enrich_bz_art(path, run_dir)
+    assert len(llm.prompts) == 1
+    assert _bz_arts(run_dir) == ["HT"]
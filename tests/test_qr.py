@@ -0,0 +1,149 @@
+from pathlib import Path
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+pytest.importorskip("numpy")
+pytest.importorskip("langsmith")
+
+from invoice_chain_ai import qr
+from invoice_chain_ai.io_utils import _loads
+
+IBAN = "CH4431999123000889012"
+
+
+def _payload(iban: str = IBAN, creditor: str = "EW AG") -> str:
+    fields = ["SPC", "0200", "1", iban, "S", creditor, "Hauptstrasse", "1", "3000", "Bern", "CH"]
+    fields += ["S", "-", "-", "-", "-", "-", "CH", "12.50", "CHF"]
+    fields += ["S", "Muster", "-", "-", "8000", "Zürich", "CH", "NON", "-", "-", "EPD"]
+    return "\n".join(fields)
+
+
+def _png(size: int) -> bytes:
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    img = np.full((size, size), 255, dtype=np.uint8)
+    img[size // 4: 3 * size // 4, size // 4: 3 * size // 4] = 0
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def _pdf(path: Path, pages) -> Path:
+    """pages: one (text, image size or None) pair per page."""
+    doc = fitz.open()
+    for text, image_size in pages:
+        page = doc.new_page()
+        if text:
+            page.insert_text((40, 60), text, fontsize=8)
+        if image_size:
+            page.insert_image(fitz.Rect(40, 500, 200, 660), stream=_png(image_size))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Fake decoder: an embedded image of size s decodes to hits[s]; renders never decode."""
+    hits = {}
+    calls = []
+
+    def fake(arr, upscale, _keepalive=None):
+        calls.append((arr.shape, upscale))
+        text = hits.get(arr.shape[0]) if upscale else None
+        return (text, "fake") if text else (None, None)
+
+    monkeypatch.setattr(qr, "_preprocess_and_decode", fake)
+    return hits, calls
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    count = []
+    original = fitz.Page.get_pixmap
+
+    def counting(self, *args, **kwargs):
+        count.append(self.number)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, "get_pixmap", counting)
+    return count
+
+
+def test_text_layer_payload_needs_no_decoding(tmp_path: Path, decodes, renders):
+    pdf = _pdf(tmp_path / "bill.pdf", [("Rechnung", None), (_payload(), None)])
+    result = qr.scan_qr_code(pdf, tmp_path / "out")
+    assert result["method"] == "text layer"
+    assert result["invoice"]["iban"] == IBAN
+    assert decodes[1] == [] and renders == []
+    written = _loads((tmp_path / "out" / "bill_qr.json").read_bytes())
+    assert written["parsed_invoice"]["iban"] == IBAN
+
+
+def test_text_layer_ignores_blocks_without_valid_iban(tmp_path: Path):
+    broken = _payload(iban="DE89370400440532013000")
+    assert qr._text_payload(broken) is None
+    # no EPD trailer: the block is not a payload
+    assert qr._text_payload(_payload().rsplit("\n", 1)[0]) is None
+    assert qr._text_payload("Einleitung\n" + _payload() + "\nSeite 2") == _payload()
+
+
+def test_text_layer_stops_at_the_last_page_payload(tmp_path: Path, monkeypatch):
+    extracted = []
+    original = fitz.Page.get_text
+
+    def counting(self, *args, **kwargs):
+        extracted.append(self.number)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, "get_text", counting)
+    pdf = _pdf(tmp_path / "bill.pdf", [("Rechnung", None), ("Details", None), (_payload(), None)])
+    with fitz.open(pdf) as doc:
+        assert qr._text_layer_qr(doc) == _payload()
+    assert extracted == [2]
+
+
+def test_embedded_images_are_decoded_before_any_render(tmp_path: Path, decodes, renders):
+    hits, calls = decodes
+    hits[300] = _payload()
+    pdf = _pdf(tmp_path / "bill.pdf", [("Rechnung", 300), ("AGB", None)])
+    result = qr.scan_qr_code(pdf, tmp_path / "out")
+    assert result["invoice"]["iban"] == IBAN
+    assert renders == []
+    assert all(upscale for _, upscale in calls)
+
+
+def test_later_pages_win(tmp_path: Path, decodes, renders):
+    hits, _ = decodes
+    hits[300] = _payload(creditor="First page AG")
+    hits[320] = _payload(creditor="Last page AG")
+    pdf = _pdf(tmp_path / "bill.pdf", [("", 300), ("", 320)])
+    result = qr.scan_qr_code(pdf, tmp_path / "out")
+    assert result["invoice"]["creditor"]["name"] == "Last page AG"
+
+
+def test_renders_follow_when_images_do_not_decode(tmp_path: Path, decodes, renders, monkeypatch):
+    monkeypatch.setattr(qr, "_ZOOM_MATRICES", (fitz.Matrix(1, 1),))
+    pdf = _pdf(tmp_path / "bill.pdf", [("Rechnung", 300), ("AGB", None)])
+    result = qr.scan_qr_code(pdf, tmp_path / "out")
+    assert result["error"] == "No QR code found"
+    _, calls = decodes
+    # the embedded image first, then slip renders last -> first page, then full renders
+    assert calls[0][1] is True
+    assert renders == [1, 0, 1, 0]
+
+
+@pytest.mark.parametrize(
+    "text, ok",
+    [
+        (_payload(), True),
+        (_payload().replace("\n", "\r\n"), True),
+        (_payload(iban="LI21088100002324013AA"), True),
+        (_payload(iban="CH44 3199 9123 0008 8901 2"), False),
+        (_payload(iban="CH443199912300088901"), False),
+        (_payload(iban="DE89370400440532013000"), False),
+        ("https://example.com/" + _payload(), False),
+    ],
+)
+def test_decoder_hits_need_header_and_iban(text: str, ok: bool):
+    assert bool(qr._QR_HEADER_IBAN_RE.match(text)) is ok
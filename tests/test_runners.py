@@ -0,0 +1,167 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("docling")
+pytest.importorskip("marker")
+
+from invoice_chain_ai import cli, runners
+from invoice_chain_ai.io_utils import _loads
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Structured output comes back per markdown file: a dict, or an exception for "fail" files."""
+    enriched = []
+
+    async def fake_batch(markdown_paths, customer_prompts, **kwargs):
+        return [
+            RuntimeError("rate limited") if "fail" in p.name else {"invoice": p.parent.name}
+            for p in markdown_paths
+        ]
+
+    async def fake_enrich(so_paths, run_dirs, concurrency):
+        enriched.extend(run_dirs)
+
+    monkeypatch.setattr(runners, "create_chat_model", lambda **kwargs: None)
+    monkeypatch.setattr(runners, "run_structured_output_modern_batch", fake_batch)
+    monkeypatch.setattr(runners, "enrich_bz_art_gather", fake_enrich)
+    return enriched
+
+
+def _run_dir(tmp_path: Path, name: str, markdown: str | None = "invoice.docling.md") -> Path:
+    run_dir = tmp_path / name
+    run_dir.mkdir()
+    if markdown:
+        (run_dir / markdown).write_text("# Rechnung", encoding="utf-8")
+    return run_dir
+
+
+def test_batch_writes_structured_output_per_run_dir(tmp_path: Path, stub_llm):
+    dirs = [_run_dir(tmp_path, "a"), _run_dir(tmp_path, "b", "fail.marker.md"), _run_dir(tmp_path, "c")]
+    mds = [runners._find_run_markdown(d) for d in dirs]
+
+    so_paths = runners.run_structured_output_batch(mds, dirs)
+
+    assert so_paths == [dirs[0] / "raw_structured_output.json", None, dirs[2] / "raw_structured_output.json"]
+    assert _loads(so_paths[0].read_bytes()) == {"invoice": "a"}
+    assert _loads(so_paths[2].read_bytes()) == {"invoice": "c"}
+    assert not (dirs[1] / "raw_structured_output.json").exists()
+    # only the successful invoices are enriched
+    assert stub_llm == [dirs[0], dirs[2]]
+
+
+def test_for_run_dirs_exit_codes(tmp_path: Path, stub_llm):
+    ok = [_run_dir(tmp_path, "a"), _run_dir(tmp_path, "b")]
+    assert runners.run_structured_output_for_run_dirs(ok) == 0
+
+    failing = _run_dir(tmp_path, "c", "fail.docling.md")
+    assert runners.run_structured_output_for_run_dirs(ok + [failing]) == 1
+
+    empty = _run_dir(tmp_path, "d", None)
+    assert runners.run_structured_output_for_run_dirs(ok + [empty]) == 1
+    assert runners.run_structured_output_for_run_dirs([empty]) == 2
+
+
+def test_cli_batches_several_run_dirs(tmp_path: Path, stub_llm):
+    dirs = [_run_dir(tmp_path, "a"), _run_dir(tmp_path, "b")]
+    argv = ["--structured-output", "--outdir", str(tmp_path / "out"), "--run-dir", *map(str, dirs)]
+
+    assert cli.run_cli(argv) == 0
+    for run_dir in dirs:
+        assert _loads((run_dir / "raw_structured_output.json").read_bytes()) == {"invoice": run_dir.name}
+    assert stub_llm == dirs
+
+
+def test_cli_rejects_several_run_dirs_outside_structured_output(tmp_path: Path, stub_llm):
+    dirs = [str(_run_dir(tmp_path, "a")), str(_run_dir(tmp_path, "b"))]
+    out = ["--outdir", str(tmp_path / "out")]
+    assert cli.run_cli([*out, "--structured-output", "--parser", "docling", "--run-dir", *dirs]) == 2
+    assert cli.run_cli([*out, "--structured-output", "--run-dir", dirs[0], str(tmp_path / "missing")]) == 2
+    assert not stub_llm
+    assert not list(tmp_path.glob("*/raw_structured_output.json"))
+
+
+def test_find_run_markdown_prefers_docling_and_pdf_stem(tmp_path: Path):
+    run_dir = _run_dir(tmp_path, "a", "bill.marker.md")
+    (run_dir / "bill.docling.md").write_text("# Rechnung", encoding="utf-8")
+    (run_dir / ".other.docling.md.tmp").write_text("partial", encoding="utf-8")
+    assert runners._find_run_markdown(run_dir) == run_dir / "bill.docling.md"
+    assert runners._find_run_markdown(run_dir, "bill") == run_dir / "bill.docling.md"
+    assert runners._find_run_markdown(run_dir, "missing") is None
+
+
+def test_qr_heuristic_retry_checks_only_the_markdown():
+    assert runners._should_retry_qr_heuristic("", "  ")
+    assert runners._should_retry_qr_heuristic("# Rechnung", "Konto CH93 0076 2011 6238 5295 7")
+    assert not runners._should_retry_qr_heuristic("# Rechnung\nTotal CHF 120.00")
+
+
+@pytest.mark.parametrize(
+    "iban", ["CH9300762011623852957", "CH0000000000000000001", "CHZZZZZZZZZZZZZZZZZZZ", "CH4431999123000889012"]
+)
+def test_iban_int_key_ignores_whitespace_and_case(iban: str):
+    assert runners._looks_like_iban(iban)
+    key = runners._iban_to_int(iban)
+    for sep in (" ", "\t", "\u00a0"):
+        spaced = sep.join(iban[i:i + 4] for i in range(0, len(iban), 4)).lower()
+        assert runners._iban_to_int(runners._normalize_iban(spaced)) == key
+
+
+@pytest.mark.parametrize("value", ["DE89370400440532013000", "CH93007620116238529", "CH93-0076-2011-6238-5295", "EW AG"])
+def test_non_swiss_iban_values_are_not_int_keyed(value: str):
+    assert not runners._looks_like_iban(runners._normalize_iban(value))
+
+
+@pytest.fixture
+def customers(monkeypatch):
+    """get_customer_by_iban stand-in over a fixed table; records every DB lookup."""
+    table = {"CH9300762011623852957": {"customer": {"id": 1, "name": "EW AG"}}}
+    lookups = []
+
+    def fake_get(value):
+        lookups.append(value)
+        return table.get(value)
+
+    monkeypatch.setattr(runners, "get_customer_by_iban", fake_get)
+    monkeypatch.setattr(runners, "_CUSTOMER_CACHE", {})
+    return table, lookups
+
+
+def test_customer_lookups_are_memoized_only_when_enabled(customers, monkeypatch):
+    table, lookups = customers
+    monkeypatch.delenv("INVOICE_CHAIN_CACHE_CUSTOMERS", raising=False)
+    runners._lookup_customer("CH9300762011623852957")
+    runners._lookup_customer("CH9300762011623852957")
+    assert len(lookups) == 2
+
+    monkeypatch.setenv("INVOICE_CHAIN_CACHE_CUSTOMERS", "1")
+    lookups.clear()
+    first = runners._lookup_customer("CH93 0076 2011 6238 5295 7")
+    again = runners._lookup_customer("CH9300762011623852957")
+    nbsp = runners._lookup_customer("ch93\u00a00076\t2011 6238 5295 7")
+    assert first == again == nbsp == table["CH9300762011623852957"]
+    # the DB sees the compact spelling, once
+    assert lookups == ["CH9300762011623852957"]
+
+
+def test_customer_misses_are_not_cached(customers, monkeypatch):
+    table, lookups = customers
+    monkeypatch.setenv("INVOICE_CHAIN_CACHE_CUSTOMERS", "1")
+    assert runners._lookup_customer("CH4431999123000889012") is None
+    table["CH4431999123000889012"] = {"customer": {"id": 2, "name": "New AG"}}
+    assert runners._lookup_customer("CH4431999123000889012")["customer"]["id"] == 2
+    assert lookups == ["CH4431999123000889012", "CH4431999123000889012"]
+
+
+def test_customer_cache_evicts_oldest(customers, monkeypatch):
+    table, lookups = customers
+    monkeypatch.setenv("INVOICE_CHAIN_CACHE_CUSTOMERS", "1")
+    monkeypatch.setattr(runners, "_CUSTOMER_CACHE_MAX", 2)
+    names = ["EW AG", "IWB", "BKW"]
+    for name in names:
+        table[name] = {"customer": {"name": name}}
+        runners._lookup_customer(name)
+    assert list(runners._CUSTOMER_CACHE) == ["IWB", "BKW"]
+    runners._lookup_customer("EW AG")
+    assert lookups.count("EW AG") == 2
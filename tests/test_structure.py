@@ -0,0 +1,56 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pydantic import ValidationError
+
+from invoice_chain_ai.structure import EnergyBill, LineItem
+
+
+def _bill():
+    return EnergyBill.model_validate({
+        "line_items": [
+            {"line_items_description": "Arbeit Hochtarif", "quantity": 120, "category": "Energie", "total_price": 30.5},
+            {"line_items_description": "Grundtarif", "total_price": 8},
+        ]
+    })
+
+
+def test_enum_fields_take_exact_values_only():
+    item = LineItem.model_validate({"category": "Netznutzung", "utility": "FK"})
+    assert (item.category, item.utility) == ("Netznutzung", "FK")
+    assert type(item.category) is str
+    for bad in ({"category": "netznutzung"}, {"category": "Energie "}, {"utility": "fk"}):
+        with pytest.raises(ValidationError):
+            LineItem.model_validate(bad)
+
+
+def test_to_columns_types_and_missing_values():
+    columns = _bill().to_columns()
+    assert set(columns) == set(LineItem.model_fields)
+    assert columns["total_price"].dtype == np.float64
+    assert columns["total_price"].sum() == pytest.approx(38.5)
+    assert np.isnan(columns["quantity"][1])
+    assert list(columns["category"]) == ["Energie", None]
+    assert list(columns["line_items_description"]) == ["Arbeit Hochtarif", "Grundtarif"]
+
+
+def test_to_columns_reflects_changed_line_items():
+    bill = _bill()
+    assert len(bill.to_columns()["total_price"]) == 2
+    bill.line_items.append(LineItem(line_items_description="Stromreserve", total_price=1.5))
+    assert bill.to_columns()["total_price"].sum() == pytest.approx(40.0)
+
+
+def test_empty_bill_has_empty_columns():
+    columns = EnergyBill().to_columns()
+    assert all(len(col) == 0 for col in columns.values())
+
+
+def test_to_arrow_matches_columns():
+    pa = pytest.importorskip("pyarrow")
+    table = _bill().to_arrow()
+    assert table.num_rows == 2
+    assert table.schema.field("total_price").type == pa.float64()
+    assert table.column("category").to_pylist() == ["Energie", None]
+    assert table.column("quantity").to_pylist() == [120.0, None]
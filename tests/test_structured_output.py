@@ -0,0 +1,115 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("langsmith")
+
+from invoice_chain_ai import postprocess_bz, structured_output
+from invoice_chain_ai.bz_mapping import BZ_MAPPING
+
+
+def _human_content(messages) -> str:
+    return messages[-1].content
+
+
+def test_bz_art_prompt_is_not_pruned(tmp_path: Path):
+    # the prompt over every quantity unit is longer than the prune threshold
+    units = {e.get("unit_quantity") or "" for e in BZ_MAPPING}
+    item_lines = ["\n- Description: Arbeit Hochtarif | quantity_unit: kWh | category: energy"]
+    prompt = postprocess_bz._single_prompt("de", units, item_lines).decode("utf-8")
+    assert len(prompt) > structured_output._PRUNE_THRESHOLD
+
+    prompt_md = tmp_path / "bz_prompt.md"
+    prompt_md.write_text(prompt, encoding="utf-8")
+    content = _human_content(structured_output._build_messages(prompt_md, None))
+
+    assert prompt in content
+
+
+def test_invoice_markdown_is_pruned_on_request(tmp_path: Path):
+    noise = "\n\n".join(f"lorem ipsum block {i}" for i in range(5_000))
+    markdown = "# Rechnung\n\n" + noise + "\n\nTotal CHF 120.00"
+    md_path = tmp_path / "invoice.md"
+    md_path.write_text(markdown, encoding="utf-8")
+
+    content = _human_content(structured_output._build_messages(md_path, None, prune=True))
+
+    assert "lorem ipsum" not in content
+    assert "Total CHF 120.00" in content
+    assert markdown in _human_content(structured_output._build_messages(md_path, None))
+
+
+class _NoRetry:
+    """Structured LLM stand-in: with_retry() hands back the runnable itself, without waits."""
+
+    def __init__(self, runnable):
+        self.runnable = runnable
+
+    def with_retry(self, **kwargs):
+        return self.runnable
+
+
+def test_batch_returns_exceptions_in_input_order(tmp_path: Path, monkeypatch):
+    from langchain_core.runnables import RunnableLambda
+
+    def answer(messages):
+        content = _human_content(messages)
+        if "fails" in content:
+            raise RuntimeError("rate limited")
+        return {"invoice": content.strip().splitlines()[-1]}
+
+    monkeypatch.setattr(
+        structured_output, "_with_energy_bill_output", lambda llm, json_mode: _NoRetry(RunnableLambda(answer))
+    )
+    paths = []
+    for name in ("first", "fails", "third"):
+        path = tmp_path / f"{name}.md"
+        path.write_text(f"# Rechnung\n{name}", encoding="utf-8")
+        paths.append(path)
+
+    results = asyncio.run(
+        structured_output.run_structured_output_modern_batch(paths, [None] * 3, llm=object())
+    )
+
+    assert results[0] == {"invoice": "first"}
+    assert isinstance(results[1], RuntimeError)
+    assert results[2] == {"invoice": "third"}
+
+
+def test_batch_does_not_retry_validation_errors(tmp_path: Path, monkeypatch):
+    from langchain_core.runnables import RunnableLambda
+    from pydantic import ValidationError
+
+    from invoice_chain_ai.structure import LineItem
+
+    calls = []
+
+    def answer(messages):
+        calls.append(messages)
+        return LineItem.model_validate({"category": "not a category"})
+
+    monkeypatch.setattr(structured_output, "_with_energy_bill_output", lambda llm, json_mode: RunnableLambda(answer))
+    path = tmp_path / "invoice.md"
+    path.write_text("# Rechnung", encoding="utf-8")
+
+    results = asyncio.run(structured_output.run_structured_output_modern_batch([path], [None], llm=object()))
+
+    assert isinstance(results[0], ValidationError)
+    assert len(calls) == 1
+
+
+def test_batch_rejects_mismatched_prompts(tmp_path: Path):
+    with pytest.raises(ValueError):
+        asyncio.run(structured_output.run_structured_output_modern_batch([tmp_path / "a.md"], [], llm=object()))
+
+
+def test_console_tracing_is_opt_in_and_read_per_call(monkeypatch):
+    monkeypatch.delenv("INVOICE_CHAIN_TRACE", raising=False)
+    assert structured_output._callback_config() == {}
+
+    monkeypatch.setenv("INVOICE_CHAIN_TRACE", "1")
+    config = structured_output._callback_config()
+    assert len(config["callbacks"]) == 1
+    assert structured_output._callback_config() is config